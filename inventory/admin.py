@@ -1,11 +1,33 @@
 from django.contrib import admin
-from .models import ProdMast, StckMain, StckDetail
+from .models import ProdMast, StckMain, StckDetail, SlowQuery, StockBalance, rebuild_stock_state
+from .slow_queries import summarize
+
+
+class StockStatusFilter(admin.SimpleListFilter):
+    """Filter on the indexed stock status of the balance row, inside the changelist query"""
+    title = 'stock status'
+    parameter_name = 'stock_status'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('low', 'Low stock'),
+            ('out', 'Out of stock'),
+            ('in', 'In stock'),
+        ]
+
+    def queryset(self, request, queryset):
+        statuses = {'low': StockBalance.LOW_STOCK, 'out': StockBalance.OUT_OF_STOCK, 'in': StockBalance.IN_STOCK}
+        if self.value() in statuses:
+            return queryset.filter(balance__status=statuses[self.value()])
+        return queryset
 
 
 @admin.register(ProdMast)
 class ProdMastAdmin(admin.ModelAdmin):
     list_display = ['product_code', 'product_name', 'unit', 'price', 'current_stock', 'minimum_stock', 'is_active']
-    list_filter = ['is_active', 'unit', 'created_at']
+    list_filter = ['is_active', StockStatusFilter, 'unit', 'created_at']
+    # Stable order for the product autocomplete used by the transaction forms
+    ordering = ['product_code']
     search_fields = ['product_code', 'product_name', 'description']
     readonly_fields = ['created_at', 'updated_at', 'current_stock']
     fieldsets = (
@@ -23,12 +45,22 @@ class ProdMastAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    # Stock comes from one join on the balance table instead of a query per row
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock()
+    
+    @admin.display(description='Current stock', ordering='stock_level')
+    def current_stock(self, obj):
+        return obj.current_stock
 
 
 class StckDetailInline(admin.TabularInline):
     model = StckDetail
     extra = 1
     fields = ['product', 'quantity', 'unit_price', 'batch_number', 'expiry_date', 'remarks']
+    # Search products as you type rather than rendering all of them into every row's <select>
+    autocomplete_fields = ['product']
 
 
 @admin.register(StckMain)
@@ -56,6 +88,35 @@ class StckMainAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
+    @admin.display(description='Total items', ordering='details_count')
+    def total_items(self, obj):
+        return obj.total_items
+    
+    @admin.display(description='Total quantity', ordering='details_quantity')
+    def total_quantity(self, obj):
+        return obj.total_quantity
+    
+    # Inline edits can change quantities, products and the transaction type,
+    # so recompute the derived stock of every product touched before and after the save.
+    def save_related(self, request, form, formsets, change):
+        product_ids = set(form.instance.details.values_list('product_id', flat=True))
+        super().save_related(request, form, formsets, change)
+        product_ids.update(form.instance.details.values_list('product_id', flat=True))
+        rebuild_stock_state(product_ids)
+    
+    def delete_model(self, request, obj):
+        product_ids = set(obj.details.values_list('product_id', flat=True))
+        super().delete_model(request, obj)
+        rebuild_stock_state(product_ids)
+    
+    def delete_queryset(self, request, queryset):
+        product_ids = set(StckDetail.objects.filter(stck_main__in=queryset).values_list('product_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_stock_state(product_ids)
 
 
 @admin.register(StckDetail)
@@ -64,7 +125,55 @@ class StckDetailAdmin(admin.ModelAdmin):
     list_filter = ['stck_main__transaction_type', 'product', 'expiry_date']
     search_fields = ['product__product_name', 'product__product_code', 'batch_number']
     readonly_fields = ['total_value', 'created_at']
+    autocomplete_fields = ['product']
     
     def total_value(self, obj):
         return f"₹{obj.total_value:,.2f}"
     total_value.short_description = 'Total Value'
+    
+    def save_model(self, request, obj, form, change):
+        product_ids = {obj.product_id}
+        if change and 'product' in form.changed_data:
+            product_ids.add(form.initial['product'])
+        super().save_model(request, obj, form, change)
+        rebuild_stock_state(product_ids)
+    
+    def delete_model(self, request, obj):
+        product_id = obj.product_id
+        super().delete_model(request, obj)
+        rebuild_stock_state([product_id])
+    
+    def delete_queryset(self, request, queryset):
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_stock_state(product_ids)
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'duration_ms', 'call_site', 'view_name', 'short_sql']
+    list_filter = ['view_name', 'created_at']
+    search_fields = ['normalized_sql', 'call_site', 'fingerprint']
+    readonly_fields = [
+        'fingerprint', 'normalized_sql', 'sql', 'params', 'duration_ms',
+        'call_site', 'stack', 'view_name', 'created_at'
+    ]
+    date_hierarchy = 'created_at'
+    
+    def short_sql(self, obj):
+        return obj.normalized_sql[:120]
+    short_sql.short_description = 'SQL'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    # Above the individual queries, group the filtered ones by SQL fingerprint
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None)
+        if context and 'cl' in context:
+            context['fingerprints'] = summarize(context['cl'].queryset)
+        return response
@@ -0,0 +1,170 @@
+"""Versioned cache for the per-product stock rows behind the dashboard, product list and inventory report.
+
+Every cached value is keyed by versions read from the database rather than
+deleted on write, so each process of a deployment sees a change as soon as it
+commits, whatever cache backend it uses:
+
+* the ledger revision (LedgerRevision.revision and updated_at), bumped by
+  every stock or product change, names the assembled list of rows;
+* each product's row is named by the product's updated_at and its balance
+  version, so rebuilding the list only recomputes the products that changed.
+
+Old keys are simply never read again and expire with the cache timeout. After a
+write commits the caches are warmed again, so the next reader does not pay for it.
+All the writes of one transaction are merged into a single warm-up, which runs
+in a background thread unless INVENTORY_CACHE_WARM_IN_BACKGROUND is False.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+
+def _timeout():
+    return getattr(settings, 'INVENTORY_CACHE_TIMEOUT', 300)
+
+
+def get_ledger_version():
+    from .models import LedgerRevision
+
+    ledger = LedgerRevision.current()
+    # updated_at keeps a restored or flushed database from reusing the keys of revisions it lost
+    return f'{ledger.revision}-{ledger.updated_at.timestamp()}'
+
+
+class _PendingWarm:
+    """on_commit callback warming the caches once for all the writes of one transaction"""
+
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        _warm_now()
+
+
+def _warm_now():
+    if getattr(settings, 'INVENTORY_CACHE_WARM_IN_BACKGROUND', True):
+        warm_in_background()
+    else:
+        warm()
+
+
+def warm_after_commit():
+    """Re-warm the caches once the current transaction commits.
+
+    Warming after the commit means the new versions are visible to the warm-up.
+    Every call inside one transaction reuses the same pending callback.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _warm_now()
+        return
+
+    pending = getattr(connection, 'inventory_pending_warm', None)
+    # Callbacks are dropped when their transaction or savepoint rolls back
+    scheduled = pending is not None and not pending.done and any(
+        func is pending for _sids, func, _robust in connection.run_on_commit
+    )
+    if not scheduled:
+        pending = connection.inventory_pending_warm = _PendingWarm()
+        transaction.on_commit(pending, robust=True)
+
+
+def _build_row(product):
+    return {
+        'id': product.id,
+        'product_code': product.product_code,
+        'product_name': product.product_name,
+        'unit': product.unit,
+        'price': product.price,
+        'minimum_stock': product.minimum_stock,
+        'stock_level': product.stock_level,
+        'stock_status': product.stock_status,
+        'last_movement_date': product.last_movement_date,
+    }
+
+
+def _build_product_rows():
+    from .models import ProdMast
+
+    versions = ProdMast.objects.filter(is_active=True).order_by('id').values_list(
+        'id', 'updated_at', 'balance__version'
+    )
+    row_keys = {
+        product_id: f'inventory:product-row:{product_id}:{updated_at.timestamp()}:v{version}'
+        for product_id, updated_at, version in versions
+    }
+    product_ids = list(row_keys)
+
+    rows = cache.get_many(list(row_keys.values()))
+
+    missing = [product_id for product_id in product_ids if row_keys[product_id] not in rows]
+    fresh = {}
+    for start in range(0, len(missing), 500):
+        for product in ProdMast.objects.with_stock().filter(id__in=missing[start:start + 500]):
+            fresh[row_keys[product.id]] = _build_row(product)
+    cache.set_many(fresh, timeout=_timeout())
+    rows.update(fresh)
+
+    return [rows[row_keys[product_id]] for product_id in product_ids if row_keys[product_id] in rows]
+
+
+def product_rows():
+    """Stock row dicts of every active product, ordered by ID"""
+    key = f'inventory:product-rows:v{get_ledger_version()}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = _build_product_rows()
+        cache.set(key, rows, timeout=_timeout())
+    return rows
+
+
+def recent_transactions(limit=10):
+    """The latest transactions with their totals annotated"""
+    from .models import StckMain
+
+    key = f'inventory:recent-transactions:{limit}:v{get_ledger_version()}'
+    transactions = cache.get(key)
+    if transactions is None:
+        transactions = list(StckMain.objects.with_totals()[:limit])
+        cache.set(key, transactions, timeout=_timeout())
+    return transactions
+
+
+def warm():
+    product_rows()
+    recent_transactions()
+
+
+_warm_lock = threading.Lock()
+_warm_state = {'running': False, 'again': False}
+
+
+def warm_in_background():
+    """Warm the caches in a worker thread; requests made while it runs are folded into one more pass"""
+    with _warm_lock:
+        if _warm_state['running']:
+            _warm_state['again'] = True
+            return
+        _warm_state['running'] = True
+    threading.Thread(target=_warm_until_idle, name='inventory-cache-warm', daemon=True).start()
+
+
+def _warm_until_idle():
+    try:
+        while True:
+            warm()
+            with _warm_lock:
+                if not _warm_state['again']:
+                    _warm_state['running'] = False
+                    return
+                _warm_state['again'] = False
+    except Exception:
+        with _warm_lock:
+            _warm_state['running'] = False
+        raise
+    finally:
+        # The thread's own database connections
+        connections.close_all()
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from inventory.models import LedgerRevision, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Build or extend the closing-balance snapshots used for historical stock queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period',
+            choices=[period for period, _label in StockSnapshot.PERIODS],
+            default=getattr(settings, 'INVENTORY_SNAPSHOT_PERIOD', 'day'),
+            help='Snapshot interval (defaults to the INVENTORY_SNAPSHOT_PERIOD setting)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop the existing snapshots of this period and recompute them from the ledger'
+        )
+
+    def handle(self, *args, **options):
+        period = options['period']
+
+        with transaction.atomic():
+            if options['rebuild']:
+                deleted, _ = StockSnapshot.objects.filter(period=period).delete()
+                self.stdout.write(self.style.WARNING(f'⟳ Dropped {deleted} {period} snapshot(s)'))
+            written = StockSnapshot.build(period)
+            if options['rebuild']:
+                LedgerRevision.record_history_change()
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Wrote {written} {period} snapshot(s)'))
@@ -81,12 +81,12 @@ class Command(BaseCommand):
         
         # Show current stock status
         self.stdout.write(self.style.SUCCESS('\n📦 CURRENT INVENTORY STATUS:'))
-        for product in ProdMast.objects.filter(is_active=True):
-            current_stock = product.current_stock
-            status = "🔴 Out of Stock" if current_stock <= 0 else "🟡 Low Stock" if current_stock <= product.minimum_stock else "🟢 In Stock"
+        status_icons = {'Out of Stock': '🔴', 'Low Stock': '🟡', 'In Stock': '🟢'}
+        for product in ProdMast.objects.with_stock().filter(is_active=True):
+            status = f"{status_icons[product.stock_status]} {product.stock_status}"
             
             self.stdout.write(
-                f'   {product.product_code}: {current_stock} {product.unit} - {status}'
+                f'   {product.product_code}: {product.stock_level} {product.unit} - {status}'
             )
         
         self.stdout.write('\n' + self.style.SUCCESS('🎉 Sample products are ready!'))
@@ -0,0 +1,360 @@
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from inventory.caching import warm_after_commit
+from inventory.models import (
+    CostLayer, LedgerRevision, ProdMast, StckMain, StckDetail, StockBalance, StockBatch, StockSnapshot,
+    StockValuation, ValuationEntry, _ProductBatches, insert_rows, insert_sql
+)
+
+
+ADJECTIVES = [
+    'Industrial', 'Compact', 'Heavy Duty', 'Premium', 'Standard', 'Wireless', 'Portable', 'Stainless',
+    'Galvanized', 'Insulated', 'Reinforced', 'Modular', 'Ergonomic', 'Waterproof', 'Digital', 'Organic',
+]
+NOUNS = [
+    'Bolt', 'Cable', 'Drill', 'Gloves', 'Hinge', 'Keyboard', 'Lamp', 'Monitor', 'Pallet', 'Pump',
+    'Rope', 'Sealant', 'Shelf', 'Switch', 'Tape', 'Valve', 'Washer', 'Wrench', 'Filter', 'Battery',
+]
+UNITS = ['pcs', 'pcs', 'pcs', 'box', 'kg', 'm', 'l', 'set']
+
+# Share of transactions of each type, before OUTs with nothing to ship become restocks
+TYPE_WEIGHTS = [('IN', 0.40), ('OUT', 0.52), ('ADJ', 0.08)]
+
+STCKMAIN_FIELDS = [
+    'id', 'transaction_id', 'transaction_date', 'transaction_type', 'reference_number',
+    'remarks', 'created_by', 'created_at', 'updated_at',
+]
+STCKDETAIL_FIELDS = [
+    'id', 'stck_main', 'product', 'quantity', 'unit_price', 'batch_number', 'expiry_date',
+    'remarks', 'signed_quantity', 'transaction_date', 'created_at',
+]
+
+
+class DerivedState:
+    """Batches, valuation and snapshots of the generated products, kept up to date as each line is generated.
+
+    The ledger is generated in date order, so applying every line as it is
+    written gives the rows StockBatch.rebuild(), StockValuation.rebuild() and
+    StockSnapshot.build() would, without reading the ledger back afterwards.
+    Snapshots are kept for the periods in snapshot_limits, up to the given
+    closing boundary.
+    """
+
+    def __init__(self, snapshot_limits):
+        self.snapshot_limits = snapshot_limits
+        self.now = timezone.now()
+        self.stock = {}
+        self.batches = {}
+        self.valuations = {}
+        # {period: {product_id: closing boundary of the product's latest period with movements}}
+        self.open_periods = {period: {} for period in snapshot_limits}
+        # {period: (start, closing boundary) of the period of the latest transaction}
+        self.periods = {}
+        self.batch_rows = []
+        self.entries = []
+        self.snapshot_rows = []
+
+    def apply(self, transaction_date, lines):
+        """Apply the (detail_id, product_id, signed_quantity, unit_price, batch_number, expiry_date) lines of one transaction"""
+        boundaries = {}
+        for period in self.snapshot_limits:
+            start, boundary = self.periods.get(period, (None, None))
+            if start is None or not start <= transaction_date < boundary:
+                start = StockSnapshot.period_start(transaction_date, period)
+                boundary = StockSnapshot.next_boundary(start, period)
+                self.periods[period] = (start, boundary)
+            boundaries[period] = boundary
+        for detail_id, product_id, signed_quantity, unit_price, batch_number, expiry_date in lines:
+            for period, boundary in boundaries.items():
+                closing = self.open_periods[period].get(product_id)
+                if closing is not None and closing != boundary:
+                    self._close_period(period, product_id, closing)
+                self.open_periods[period][product_id] = boundary
+            self.stock[product_id] = self.stock.get(product_id, 0) + signed_quantity
+
+            batches = self.batches.setdefault(product_id, _ProductBatches())
+            for batch in StockBatch._apply_line(
+                batches, product_id, batch_number, expiry_date, signed_quantity, transaction_date
+            ):
+                if batch.batch_number and not batch.quantity:
+                    # A generated batch is only received once, so once empty it never changes again
+                    del batches[batch.batch_number]
+                    self.batch_rows.append(batch)
+
+            if product_id not in self.valuations:
+                self.valuations[product_id] = (StockValuation(product_id=product_id), deque())
+            valuation, layers = self.valuations[product_id]
+            _changed, entry = valuation._apply_line(layers, detail_id, transaction_date, signed_quantity, unit_price)
+            self.entries.append(entry)
+
+    def _close_period(self, period, product_id, closing):
+        if closing <= self.snapshot_limits[period]:
+            self.snapshot_rows.append((product_id, period, closing, self.stock[product_id]))
+
+    def flush(self):
+        """Write the entries, emptied batches and closed periods collected so far"""
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        now = adapt_datetime(self.now)
+        ValuationEntry.insert(self.entries)
+        insert_rows(StockBatch, StockBatch.INSERT_FIELDS, StockBatch._rows(self.batch_rows, now))
+        insert_rows(StockSnapshot, StockSnapshot.INSERT_FIELDS, [
+            (product_id, period, adapt_datetime(closing), quantity, now)
+            for product_id, period, closing, quantity in self.snapshot_rows
+        ])
+        self.entries, self.batch_rows, self.snapshot_rows = [], [], []
+
+    def finish(self):
+        """Write what is still open: batches with stock, valuations with their layers, and the last periods"""
+        for period, open_periods in self.open_periods.items():
+            for product_id, closing in open_periods.items():
+                self._close_period(period, product_id, closing)
+        for batches in self.batches.values():
+            self.batch_rows.extend(batches.values())
+        with transaction.atomic():
+            self.flush()
+            insert_rows(CostLayer, CostLayer.INSERT_FIELDS, [
+                layer._row() for _valuation, layers in self.valuations.values() for layer in layers
+            ])
+            insert_rows(StockValuation, StockValuation.INSERT_FIELDS, [
+                valuation._row(self.now) for valuation, _layers in self.valuations.values()
+            ])
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic warehouse (products and a stock ledger) for load and performance testing. '
+        'The same --seed and --end-date always produce the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Number of products to create')
+        parser.add_argument('--transactions', type=int, default=10000, help='Number of stock transactions to create')
+        parser.add_argument('--lines-per-transaction', type=int, default=5, help='Average detail lines per transaction')
+        parser.add_argument('--days', type=int, default=365, help='Days of history the transactions are spread over')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--end-date', help='Last day of the generated history, YYYY-MM-DD (default: today)')
+        parser.add_argument('--prefix', default='SYN', help='Prefix of the generated product codes and transaction IDs')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Detail rows written per database transaction')
+        parser.add_argument('--skip-snapshots', action='store_true', help='Do not build stock snapshots afterwards')
+
+    def handle(self, *args, **options):
+        for name in ('products', 'lines_per_transaction', 'days', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['transactions'] < 0:
+            raise CommandError('--transactions cannot be negative')
+
+        end_date = timezone.localdate()
+        if options['end_date']:
+            end_date = parse_date(options['end_date'])
+            if not end_date:
+                raise CommandError(f"Invalid --end-date '{options['end_date']}'")
+        self.end = timezone.make_aware(datetime.combine(end_date, datetime.min.time()))
+        self.start = self.end - timedelta(days=options['days'])
+
+        self.prefix = options['prefix'].upper()
+        self.chunk_size = options['chunk_size']
+        if ProdMast.objects.filter(product_code__startswith=self.prefix).exists() or \
+                StckMain.objects.filter(transaction_id__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"Data with prefix '{self.prefix}' already exists; choose another --prefix")
+
+        self.rng = random.Random(options['seed'])
+        self.started = time.monotonic()
+        self.derived = DerivedState(self._snapshot_limits(options['skip_snapshots']))
+
+        products = self._create_products(options['products'])
+        details = self._create_transactions(products, options['transactions'], options['lines_per_transaction'])
+
+        self.stdout.write(self.style.SUCCESS('Writing stock balances, batches, valuation and snapshots...'))
+        self.derived.finish()
+        # Only the new products have movements; the prefix is unused before this run
+        StockBalance.rebuild(ProdMast.objects.filter(product_code__startswith=self.prefix))
+        LedgerRevision.record(self.start, self.end)
+        # Products without movements are in the product list too
+        warm_after_commit()
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Generated {len(products)} product(s), {options["transactions"]} transaction(s) '
+            f'and {details} detail line(s) in {time.monotonic() - self.started:.1f}s'
+        ))
+        self.stdout.write('=' * 60)
+
+    def _snapshot_limits(self, skip_snapshots):
+        """Closing boundary up to which each period's snapshots are written for the generated products.
+
+        Periods that already have snapshots are kept to their horizon, like
+        StockSnapshot.rebuild(). Unless skipped, the configured period is first
+        built up to the current period for the existing data, then written that
+        far for the new products too, like StockSnapshot.build().
+        """
+        limits = {}
+        for period, _label in StockSnapshot.PERIODS:
+            horizon = StockSnapshot.objects.filter(period=period).aggregate(horizon=Max('period_end'))['horizon']
+            if horizon is not None:
+                limits[period] = horizon
+        if not skip_snapshots:
+            period = getattr(settings, 'INVENTORY_SNAPSHOT_PERIOD', 'day')
+            if period in limits:
+                with transaction.atomic():
+                    StockSnapshot.build(period)
+            limits[period] = StockSnapshot.period_start(timezone.now(), period)
+        return limits
+
+    def _create_products(self, count):
+        """Create the products; returns a list of (id, price, minimum_stock)"""
+        rng = self.rng
+        products = []
+        for start in range(0, count, self.chunk_size):
+            batch = []
+            for number in range(start + 1, min(start + self.chunk_size, count) + 1):
+                batch.append(ProdMast(
+                    product_code=f'{self.prefix}{number:06d}',
+                    product_name=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}',
+                    unit=rng.choice(UNITS),
+                    price=Decimal(rng.randint(50, 500000)) / 100,
+                    minimum_stock=rng.randint(5, 50),
+                ))
+            with transaction.atomic():
+                ProdMast.objects.bulk_create(batch, batch_size=1000)
+            ids = dict(
+                ProdMast.objects.filter(product_code__in=[product.product_code for product in batch])
+                .values_list('product_code', 'id')
+            )
+            products.extend((ids[product.product_code], product.price, product.minimum_stock) for product in batch)
+        self.stdout.write(f'   {len(products)} products created')
+        return products
+
+    def _create_transactions(self, products, count, lines_per_transaction):
+        """Create the ledger in date order, tracking stock so no OUT ever exceeds it.
+
+        Rows are written as tuples, with IDs assigned here, through executemany()
+        of a single-row INSERT per table and chunk, since building a model
+        instance per line limits bulk_create() to a few thousand rows per second.
+        """
+        rng = self.rng
+        ops = connection.ops
+        stock = [0] * len(products)
+        span = (self.end - self.start).total_seconds()
+        max_lines = min(len(products), 2 * lines_per_transaction - 1)
+        now = ops.adapt_datetimefield_value(timezone.now())
+        next_main_id = (StckMain.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        next_detail_id = (StckDetail.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+        headers = []
+        lines = []
+        self.written = 0
+        for number in range(count):
+            # Evenly spread, jittered timestamps keep the ledger in date order without sorting
+            transaction_date = self.start + timedelta(seconds=span * (number + rng.random()) / count)
+            transaction_type = self._choose_type()
+
+            # Popular products (low indexes) move far more often than the long tail
+            wanted = rng.randint(1, max_lines)
+            picked = set()
+            while len(picked) < wanted:
+                picked.add(int(len(products) * rng.random() ** 2))
+
+            items = []
+            for index in sorted(picked):
+                product_id, price, minimum_stock = products[index]
+                if transaction_type == 'OUT':
+                    if not stock[index]:
+                        continue
+                    quantity = min(stock[index], rng.randint(1, minimum_stock))
+                elif transaction_type == 'IN':
+                    quantity = rng.randint(minimum_stock, minimum_stock * 4 + 20)
+                else:
+                    quantity = rng.randint(1, 5)
+                items.append((index, product_id, price, quantity))
+            if not items:
+                # Nothing on hand to ship, so restock instead
+                transaction_type = 'IN'
+                index = min(picked)
+                product_id, price, minimum_stock = products[index]
+                items.append((index, product_id, price, rng.randint(minimum_stock, minimum_stock * 4 + 20)))
+
+            main_id = next_main_id
+            next_main_id += 1
+            stored_date = ops.adapt_datetimefield_value(transaction_date)
+            headers.append((
+                main_id,
+                f'{self.prefix}-{number + 1:08d}',
+                stored_date,
+                transaction_type,
+                f'{"PO" if transaction_type == "IN" else "SO"}-{rng.randint(1, 999999):06d}',
+                '',
+                'generator',
+                now,
+                now,
+            ))
+            sign = StckMain.STOCK_SIGNS[transaction_type]
+            derived_lines = []
+            for index, product_id, price, quantity in items:
+                stock[index] += sign * quantity
+                unit_price = price
+                batch_number = ''
+                expiry_date = None
+                if transaction_type == 'IN':
+                    unit_price = (price * Decimal(rng.randint(90, 110)) / 100).quantize(Decimal('0.01'))
+                    batch_number = f'B{number + 1:08d}'
+                    # Every fifth product is perishable
+                    if index % 5 == 0:
+                        expiry_date = transaction_date.date() + timedelta(days=rng.randint(30, 540))
+                unit_price = max(unit_price, Decimal('0.01'))
+                lines.append((
+                    next_detail_id,
+                    main_id,
+                    product_id,
+                    quantity,
+                    ops.adapt_decimalfield_value(unit_price),
+                    batch_number,
+                    ops.adapt_datefield_value(expiry_date),
+                    '',
+                    sign * quantity,
+                    stored_date,
+                    now,
+                ))
+                derived_lines.append((next_detail_id, product_id, sign * quantity, unit_price, batch_number, expiry_date))
+                next_detail_id += 1
+            self.derived.apply(transaction_date, derived_lines)
+
+            if len(lines) >= self.chunk_size:
+                self._flush(headers, lines)
+                headers, lines = [], []
+        if headers:
+            self._flush(headers, lines)
+
+        # Explicit IDs leave database sequences behind (a no-op on SQLite)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [StckMain, StckDetail]):
+                cursor.execute(sql)
+        return self.written
+
+    def _choose_type(self):
+        roll = self.rng.random()
+        for transaction_type, weight in TYPE_WEIGHTS:
+            if roll < weight:
+                return transaction_type
+            roll -= weight
+        return TYPE_WEIGHTS[-1][0]
+
+    def _flush(self, headers, lines):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(insert_sql(StckMain, STCKMAIN_FIELDS), headers)
+            cursor.executemany(insert_sql(StckDetail, STCKDETAIL_FIELDS), lines)
+            self.derived.flush()
+        self.written += len(lines)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'   {self.written} detail lines written ({self.written / elapsed:,.0f} rows/sec)')
@@ -0,0 +1,297 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from inventory.models import (
+    LedgerRevision, ProdMast, StckMain, StckDetail, StockBalance, StockBatch, StockSnapshot, StockValuation
+)
+
+
+TRANSACTION_TYPES = {code for code, _label in StckMain.TRANSACTION_TYPES}
+
+# Product code -> ID map, set once per parsing process
+_product_ids = {}
+
+
+def _init_worker(product_ids):
+    global _product_ids
+    _product_ids = product_ids
+
+
+def _parse_datetime(value):
+    parsed = parse_datetime(value)
+    if not parsed:
+        parsed_date = parse_date(value)
+        if not parsed_date:
+            raise ValueError(f"invalid transaction_date '{value}'")
+        parsed = timezone.datetime.combine(parsed_date, timezone.datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_record(record, default_created_by):
+    """Turn one raw record into a tuple of model values; raises ValueError when invalid"""
+    transaction_id = (record.get('transaction_id') or '').strip().upper()
+    if not transaction_id:
+        raise ValueError('transaction_id is required')
+    transaction_type = (record.get('transaction_type') or '').strip().upper()
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ValueError(f"invalid transaction_type '{transaction_type}'")
+    product_code = (record.get('product_code') or '').strip().upper()
+    if product_code not in _product_ids:
+        raise ValueError(f"unknown product_code '{product_code}'")
+    try:
+        quantity = int(record.get('quantity'))
+        unit_price = Decimal(str(record.get('unit_price')))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError('quantity and unit_price must be numbers')
+    if quantity <= 0 or unit_price <= 0:
+        raise ValueError('quantity and unit_price must be greater than 0')
+    expiry_date = None
+    if record.get('expiry_date'):
+        expiry_date = parse_date(str(record['expiry_date']))
+        if not expiry_date:
+            raise ValueError(f"invalid expiry_date '{record['expiry_date']}'")
+
+    return (
+        transaction_id,
+        _parse_datetime(str(record.get('transaction_date') or '')),
+        transaction_type,
+        record.get('reference_number') or '',
+        record.get('created_by') or default_created_by,
+        _product_ids[product_code],
+        quantity,
+        unit_price,
+        record.get('batch_number') or '',
+        expiry_date,
+        record.get('remarks') or '',
+    )
+
+
+def _parse_block(block):
+    """Parse (numbered_records, input_format, fieldnames, created_by) into rows and errors.
+
+    CSV records arrive already split into fields, NDJSON records as raw lines.
+    """
+    records, input_format, fieldnames, created_by = block
+    rows = []
+    errors = []
+    for record_number, raw in records:
+        try:
+            if input_format == 'csv':
+                if not raw:
+                    continue
+                record = dict(zip(fieldnames, raw))
+            else:
+                if not raw.strip():
+                    continue
+                record = json.loads(raw)
+                if not isinstance(record, dict):
+                    raise ValueError('each line must be a JSON object')
+            rows.append((record_number, _parse_record(record, created_by)))
+        except ValueError as e:
+            errors.append((record_number, str(e)))
+    return rows, errors
+
+
+def _parse_in_pool(pool, blocks, window):
+    """Parse blocks in worker processes, feeding at most `window` blocks at a time"""
+    while True:
+        batch = list(islice(blocks, window))
+        if not batch:
+            return
+        yield from pool.imap(_parse_block, batch)
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical stock movements from a CSV or NDJSON export. '
+        'Rows sharing a transaction_id must be adjacent and become one transaction. '
+        'Stock availability is not checked, since the ledger is replayed as recorded. '
+        'An interrupted import resumes after the last record it committed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with header row) or NDJSON file to import')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Detail rows committed per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Processes used to parse the input')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--created-by', default='import', help='created_by for rows that do not set it')
+        parser.add_argument('--skip-invalid', action='store_true', help='Report and skip invalid rows instead of aborting')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        self.chunk_size = options['chunk_size']
+        self.skip_invalid = options['skip_invalid']
+        self.checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        if self.chunk_size < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        records_done = self._read_checkpoint()
+        if records_done:
+            self.stdout.write(self.style.WARNING(f'⟳ Resuming after record {records_done}'))
+
+        product_ids = {code.upper(): product_id for code, product_id in ProdMast.objects.values_list('product_code', 'id')}
+        self.imported = 0
+        self.invalid = 0
+        self.already_imported = 0
+        # The checkpoint is written after each chunk commits, so the chunk after
+        # it may be in the database already when the earlier run stopped in between
+        self.resuming = bool(records_done)
+        # A resumed import cannot tell which products the earlier run touched
+        self.product_ids = None if records_done else set()
+        self.earliest = self.latest = None
+        self.started = time.monotonic()
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            fieldnames = None
+            records = stream
+            if input_format == 'csv':
+                # One reader over the whole file, since quoted fields may span lines
+                records = csv.reader(stream)
+                fieldnames = next(records, [])
+                missing = {'transaction_id', 'transaction_type', 'transaction_date', 'product_code', 'quantity', 'unit_price'} - set(fieldnames)
+                if missing:
+                    raise CommandError(f"Missing CSV column(s): {', '.join(sorted(missing))}")
+            numbered = islice(enumerate(records, start=1), records_done, None)
+
+            blocks = self._blocks(numbered, input_format, fieldnames, options['created_by'])
+            if options['workers'] > 1:
+                with Pool(options['workers'], initializer=_init_worker, initargs=(product_ids,)) as pool:
+                    self._import(_parse_in_pool(pool, blocks, options['workers'] * 2))
+            else:
+                _init_worker(product_ids)
+                self._import(map(_parse_block, blocks))
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding stock snapshots, batches and valuation...'))
+        for period, _label in StockSnapshot.PERIODS:
+            StockSnapshot.rebuild(period, self.product_ids)
+        # Batches and valuation are replayed in date order, which a back-dated import changes
+        StockBatch.rebuild(self.product_ids)
+        StockValuation.rebuild(self.product_ids)
+        # Historical reports read the snapshots, so they change again here
+        LedgerRevision.record(self.earliest, self.latest)
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write(self.style.SUCCESS(f'✅ Imported {self.imported} row(s) in {time.monotonic() - self.started:.1f}s'))
+        if self.invalid:
+            self.stdout.write(self.style.WARNING(f'   Skipped {self.invalid} invalid row(s)'))
+        if self.already_imported:
+            self.stdout.write(self.style.WARNING(f'   Skipped {self.already_imported} row(s) imported before the interruption'))
+        self.stdout.write('=' * 60)
+
+    def _blocks(self, numbered_records, input_format, fieldnames, created_by):
+        """Yield the (record_number, record) pairs in blocks of chunk_size"""
+        while True:
+            records = list(islice(numbered_records, self.chunk_size))
+            if not records:
+                return
+            yield records, input_format, fieldnames, created_by
+
+    def _import(self, parsed_blocks):
+        pending = []
+        for rows, errors in parsed_blocks:
+            for record_number, message in errors:
+                if not self.skip_invalid:
+                    raise CommandError(f'Record {record_number}: {message}')
+                self.invalid += 1
+                self.stderr.write(f'   Record {record_number}: {message}')
+            for record_number, row in rows:
+                # Only cut chunks between transactions so each header is written once
+                if len(pending) >= self.chunk_size and row[0] != pending[-1][1][0]:
+                    self._flush(pending)
+                    pending = []
+                pending.append((record_number, row))
+        if pending:
+            self._flush(pending)
+
+    def _flush(self, pending):
+        if self.resuming:
+            pending = self._skip_imported(pending)
+            if not pending:
+                return
+        headers = {}
+        for _record_number, row in pending:
+            if row[0] not in headers:
+                headers[row[0]] = StckMain(
+                    transaction_id=row[0],
+                    transaction_date=row[1],
+                    transaction_type=row[2],
+                    reference_number=row[3],
+                    created_by=row[4],
+                )
+
+        deltas = {}
+        try:
+            with transaction.atomic():
+                StckMain.objects.bulk_create(headers.values(), batch_size=1000)
+                details = []
+                for _record_number, row in pending:
+                    detail = StckDetail(
+                        stck_main=headers[row[0]],
+                        product_id=row[5],
+                        quantity=row[6],
+                        unit_price=row[7],
+                        batch_number=row[8],
+                        expiry_date=row[9],
+                        remarks=row[10],
+                    )
+                    detail.sync_from_main()
+                    details.append(detail)
+                    deltas[row[5]] = deltas.get(row[5], 0) + detail.signed_quantity
+                StckDetail.objects.bulk_create(details, batch_size=1000)
+                StockBalance.apply_movements(deltas, moved_at=details[-1].created_at)
+                dates = [header.transaction_date for header in headers.values()]
+                LedgerRevision.record(min(dates), max(dates))
+        except IntegrityError as e:
+            raise CommandError(
+                f'Could not import records {pending[0][0]}-{pending[-1][0]}: {e}. '
+                'Transaction IDs must be new and each transaction must list a product once.'
+            )
+
+        if self.product_ids is not None:
+            self.product_ids.update(deltas)
+        self.earliest = min(filter(None, [self.earliest] + dates))
+        self.latest = max(filter(None, [self.latest] + dates))
+        self._write_checkpoint(pending[-1][0])
+        self.imported += len(pending)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'   {self.imported} rows imported ({self.imported / elapsed:,.0f} rows/sec)')
+
+    def _skip_imported(self, pending):
+        """Drop the rows of transactions committed by the interrupted run; the rest are new"""
+        existing = set(StckMain.objects.filter(
+            transaction_id__in={row[0] for _record_number, row in pending}
+        ).values_list('transaction_id', flat=True))
+        if not existing:
+            # Chunks only end between transactions, so nothing after this was committed either
+            self.resuming = False
+            return pending
+        self.already_imported += sum(row[0] in existing for _record_number, row in pending)
+        self._write_checkpoint(pending[-1][0])
+        return [(record_number, row) for record_number, row in pending if row[0] not in existing]
+
+    def _read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding='utf-8') as checkpoint:
+            return json.load(checkpoint)['records_done']
+
+    def _write_checkpoint(self, records_done):
+        temp_path = f'{self.checkpoint_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as checkpoint:
+            json.dump({'records_done': records_done}, checkpoint)
+        os.replace(temp_path, self.checkpoint_path)
@@ -0,0 +1,62 @@
+import io
+import pstats
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.profiling import load_profiles, profile_dir
+
+
+class Command(BaseCommand):
+    help = 'List the request profiles saved by ProfilingMiddleware and print the top functions per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Profile directory (defaults to the INVENTORY_PROFILE_DIR setting)')
+        parser.add_argument('--view', help='Only profiles of this URL name, e.g. inventory:dashboard')
+        parser.add_argument('--top', type=int, default=20, help='Functions printed per view')
+        parser.add_argument(
+            '--sort',
+            choices=['cumulative', 'tottime', 'ncalls'],
+            default='cumulative',
+            help='Order of the printed functions'
+        )
+        parser.add_argument('--list', action='store_true', help='List the profiles without aggregating them')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profile_dir()
+        profiles = load_profiles(directory)
+        if options['view']:
+            profiles = [profile for profile in profiles if profile['view'] == options['view']]
+        if not profiles:
+            raise CommandError(f'No profiles found in {directory}')
+
+        if options['list']:
+            for profile in profiles:
+                self.stdout.write(
+                    f"{profile['id']}  {profile['method']} {profile['url']}  {profile['status']}  "
+                    f"{profile['duration_ms']:.1f} ms  {profile['queries']} queries"
+                )
+            return
+
+        by_view = {}
+        for profile in profiles:
+            by_view.setdefault(profile['view'], []).append(profile)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(profiles)} profile(s) in {directory}'))
+        self.stdout.write(f"{'View':<45} {'Count':>6} {'Median ms':>10} {'Max ms':>10} {'Queries':>8} {'SQL ms':>8}")
+        for view, view_profiles in sorted(by_view.items()):
+            durations = [profile['duration_ms'] for profile in view_profiles]
+            self.stdout.write(
+                f"{view:<45} {len(view_profiles):>6} {statistics.median(durations):>10.1f} {max(durations):>10.1f} "
+                f"{statistics.mean(profile['queries'] for profile in view_profiles):>8.1f} "
+                f"{statistics.mean(profile['sql_ms'] for profile in view_profiles):>8.1f}"
+            )
+
+        for view, view_profiles in sorted(by_view.items()):
+            self.stdout.write('\n' + '=' * 60)
+            self.stdout.write(self.style.SUCCESS(f'{view} ({len(view_profiles)} profile(s))'))
+            self.stdout.write('=' * 60)
+            # pstats prints piecemeal, which OutputWrapper would split into lines
+            buffer = io.StringIO()
+            stats = pstats.Stats(*[profile['path'] for profile in view_profiles], stream=buffer)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+            self.stdout.write(buffer.getvalue())
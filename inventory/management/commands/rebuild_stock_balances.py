@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from inventory.models import ProdMast, StockBalance
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized stock balances from the stock ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            action='append',
+            dest='product_codes',
+            metavar='PRODUCT_CODE',
+            help='Only rebuild the given product code (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        product_ids = None
+        product_codes = options['product_codes']
+        if product_codes:
+            product_ids = list(
+                ProdMast.objects.filter(product_code__in=product_codes).values_list('id', flat=True)
+            )
+            if len(product_ids) != len(set(product_codes)):
+                raise CommandError('One or more product codes were not found')
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding stock balances...'))
+
+        with transaction.atomic():
+            drifted = StockBalance.rebuild(product_ids)
+
+        if drifted:
+            self.stdout.write(self.style.WARNING(f'⟳ Corrected {drifted} drifted balance(s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ All balances match the ledger'))
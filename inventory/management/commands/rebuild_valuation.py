@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from inventory.models import LedgerRevision, ProdMast, StockValuation
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the weighted-average and FIFO stock valuation from the stock ledger. '
+        'Run after editing or deleting ledger lines outside the application.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            action='append',
+            dest='product_codes',
+            metavar='PRODUCT_CODE',
+            help='Only rebuild the given product code (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        product_ids = None
+        product_codes = options['product_codes']
+        if product_codes:
+            product_ids = list(
+                ProdMast.objects.filter(product_code__in=product_codes).values_list('id', flat=True)
+            )
+            if len(product_ids) != len(set(product_codes)):
+                raise CommandError('One or more product codes were not found')
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding stock valuation...'))
+
+        with transaction.atomic():
+            valued = StockValuation.rebuild(product_ids)
+            LedgerRevision.record_history_change()
+
+        valuations = StockValuation.objects.all()
+        if product_ids is not None:
+            valuations = valuations.filter(product_id__in=product_ids)
+        totals = valuations.aggregate(average=Sum('average_value'), fifo=Sum('fifo_value'))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Valued {valued} product(s): {totals['average'] or 0:.2f} at average cost, "
+            f"{totals['fifo'] or 0:.2f} at FIFO cost"
+        ))
@@ -0,0 +1,215 @@
+"""Per-view request latency and database usage, exported in Prometheus text format.
+
+Each process keeps its counters in memory and writes them, at most once per
+INVENTORY_METRICS_FLUSH_INTERVAL seconds, to its own file in
+INVENTORY_METRICS_DIR. The /metrics endpoint sums the files of every process,
+so all gunicorn workers are reported no matter which one serves the scrape.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_lock = threading.Lock()
+_views = {}
+_last_flush = 0.0
+
+
+def _metrics_dir():
+    return getattr(
+        settings, 'INVENTORY_METRICS_DIR',
+        os.path.join(tempfile.gettempdir(), 'warehouse-inventory-metrics')
+    )
+
+
+def _new_view():
+    return {
+        'requests': {},
+        'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+        'latency_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'sql_seconds': 0.0,
+    }
+
+
+def record(view, status, duration, queries, sql_seconds):
+    """Add one request to this process's counters"""
+    status_class = f'{status // 100}xx'
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = _new_view()
+        stats['requests'][status_class] = stats['requests'].get(status_class, 0) + 1
+        stats['latency'][bisect_left(LATENCY_BUCKETS, duration)] += 1
+        stats['latency_sum'] += duration
+        stats['queries'][bisect_left(QUERY_BUCKETS, queries)] += 1
+        stats['queries_sum'] += queries
+        stats['sql_seconds'] += sql_seconds
+
+
+def flush(force=False):
+    """Write this process's counters to the shared directory, at most once per interval"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'INVENTORY_METRICS_FLUSH_INTERVAL', 1.0):
+        return
+    _last_flush = now
+    with _lock:
+        payload = json.dumps(_views)
+
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as stream:
+        stream.write(payload)
+    os.replace(temp_path, path)
+
+
+def collect():
+    """Sum the counters of every process that has written to the shared directory"""
+    flush(force=True)
+    directory = _metrics_dir()
+    totals = {}
+    for name in os.listdir(directory):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as stream:
+                views = json.load(stream)
+        except (OSError, ValueError):
+            # Removed or half-written by another process
+            continue
+        for view, stats in views.items():
+            total = totals.setdefault(view, _new_view())
+            for status_class, count in stats['requests'].items():
+                total['requests'][status_class] = total['requests'].get(status_class, 0) + count
+            for key in ('latency', 'queries'):
+                total[key] = [a + b for a, b in zip(total[key], stats[key])]
+            for key in ('latency_sum', 'queries_sum', 'sql_seconds'):
+                total[key] += stats[key]
+    return totals
+
+
+def _histogram(lines, name, view, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {cumulative}')
+    lines.append(f'{name}_sum{{view="{view}"}} {total}')
+    lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+
+
+def render():
+    """Prometheus text exposition of the collected metrics"""
+    totals = sorted(collect().items())
+    lines = [
+        '# HELP inventory_requests_total Requests served, by URL name and status class.',
+        '# TYPE inventory_requests_total counter',
+    ]
+    for view, stats in totals:
+        for status_class, count in sorted(stats['requests'].items()):
+            lines.append(f'inventory_requests_total{{view="{view}",status="{status_class}"}} {count}')
+
+    lines += [
+        '# HELP inventory_request_duration_seconds Request latency, by URL name.',
+        '# TYPE inventory_request_duration_seconds histogram',
+    ]
+    for view, stats in totals:
+        _histogram(lines, 'inventory_request_duration_seconds', view, LATENCY_BUCKETS, stats['latency'], stats['latency_sum'])
+
+    lines += [
+        '# HELP inventory_db_queries_per_request Database queries run by each request, by URL name.',
+        '# TYPE inventory_db_queries_per_request histogram',
+    ]
+    for view, stats in totals:
+        _histogram(lines, 'inventory_db_queries_per_request', view, QUERY_BUCKETS, stats['queries'], stats['queries_sum'])
+
+    lines += [
+        '# HELP inventory_db_query_seconds_total Time spent in database queries, by URL name.',
+        '# TYPE inventory_db_query_seconds_total counter',
+    ]
+    for view, stats in totals:
+        lines.append(f'inventory_db_query_seconds_total{{view="{view}"}} {stats["sql_seconds"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """Database execute wrapper counting the queries of one request and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run on any database inside the block, in the current thread"""
+    timer = QueryTimer()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        yield timer
+
+
+class MetricsMiddleware:
+    """Record latency and query counts of every request under its resolved URL name.
+
+    Streaming responses are measured up to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with count_queries() as timer:
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # The async ORM runs a request's queries in one worker thread, so the
+        # connections are wrapped in that thread rather than in the event loop
+        stack = ExitStack()
+        timer = await sync_to_async(stack.enter_context)(count_queries())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self._record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def _record(self, request, response, duration, timer):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        record(view, response.status_code, duration, timer.count, timer.seconds)
+        flush()
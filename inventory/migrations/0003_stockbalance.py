@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, Q, Sum
+
+
+def populate_balances(apps, schema_editor):
+    ProdMast = apps.get_model('inventory', 'ProdMast')
+    StckDetail = apps.get_model('inventory', 'StckDetail')
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+
+    ledger = {
+        row['product']: row
+        for row in StckDetail.objects.values('product').annotate(
+            stock_in=Sum('quantity', filter=Q(stck_main__transaction_type='IN')),
+            stock_out=Sum('quantity', filter=Q(stck_main__transaction_type='OUT')),
+            last_movement_at=Max('created_at'),
+        )
+    }
+    balances = []
+    for product_id in ProdMast.objects.values_list('id', flat=True):
+        row = ledger.get(product_id)
+        balances.append(StockBalance(
+            product_id=product_id,
+            quantity=((row['stock_in'] or 0) - (row['stock_out'] or 0)) if row else 0,
+            last_movement_at=row['last_movement_at'] if row else None,
+        ))
+    StockBalance.objects.bulk_create(balances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_auto_20250726_1522'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('product', models.OneToOneField(help_text='Product this balance belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='inventory.prodmast')),
+                ('quantity', models.IntegerField(default=0, help_text='On-hand quantity')),
+                ('last_movement_at', models.DateTimeField(blank=True, help_text='Time of the last movement', null=True)),
+                ('version', models.PositiveIntegerField(default=0, help_text='Incremented on every change')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Balance',
+                'verbose_name_plural': 'Stock Balances',
+                'db_table': 'stckbalance',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stockbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Daily'), ('month', 'Monthly')], help_text='Snapshot interval', max_length=5)),
+                ('period_end', models.DateTimeField(help_text='Closing boundary; includes movements dated before it')),
+                ('quantity', models.IntegerField(help_text='Closing balance at period_end')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(help_text='Product this snapshot belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.prodmast')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'db_table': 'stcksnapshot',
+                'indexes': [models.Index(fields=['product', 'period_end'], name='stcksnapsho_product_6274b0_idx')],
+                'unique_together': {('product', 'period', 'period_end')},
+            },
+        ),
+    ]
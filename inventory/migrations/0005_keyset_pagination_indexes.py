@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stckdetail',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='stckdetail_product_9b92b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stckmain',
+            index=models.Index(fields=['transaction_date', 'id'], name='stckmain_transac_6caf42_idx'),
+        ),
+    ]
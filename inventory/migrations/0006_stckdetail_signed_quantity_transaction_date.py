@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+
+
+def backfill_ledger_columns(apps, schema_editor):
+    StckMain = apps.get_model('inventory', 'StckMain')
+    StckDetail = apps.get_model('inventory', 'StckDetail')
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+    StockSnapshot = apps.get_model('inventory', 'StockSnapshot')
+
+    main = StckMain.objects.filter(pk=OuterRef('stck_main_id'))
+    StckDetail.objects.update(transaction_date=Subquery(main.values('transaction_date')[:1]))
+    StckDetail.objects.filter(stck_main__transaction_type__in=['IN', 'ADJ']).update(signed_quantity=F('quantity'))
+    StckDetail.objects.filter(stck_main__transaction_type='OUT').update(signed_quantity=-F('quantity'))
+
+    # Adjustments were previously left out of the stock math
+    adjusted = set(
+        StckDetail.objects.filter(stck_main__transaction_type='ADJ').values_list('product_id', flat=True)
+    )
+    totals = StckDetail.objects.filter(product_id__in=adjusted).values('product_id').annotate(total=Sum('signed_quantity'))
+    for row in totals:
+        StockBalance.objects.filter(product_id=row['product_id']).update(quantity=row['total'])
+    StockSnapshot.objects.filter(product_id__in=adjusted).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stckdetail',
+            name='signed_quantity',
+            field=models.IntegerField(default=0, help_text='Quantity with the sign of the transaction type (negative for stock out)'),
+        ),
+        migrations.AddField(
+            model_name='stckdetail',
+            name='transaction_date',
+            field=models.DateTimeField(help_text='Copy of the transaction date', null=True),
+        ),
+        migrations.RunPython(backfill_ledger_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stckdetail_signed_quantity_transaction_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stckdetail',
+            name='transaction_date',
+            field=models.DateTimeField(help_text='Copy of the transaction date'),
+        ),
+        migrations.AddIndex(
+            model_name='stckdetail',
+            index=models.Index(fields=['product', 'transaction_date'], name='stckdetail_product_9ba988_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stckdetail',
+            index=models.Index(fields=['transaction_date'], name='stckdetail_transac_9a2332_idx'),
+        ),
+    ]
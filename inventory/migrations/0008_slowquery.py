@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stckdetail_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, help_text='Hash of the normalized SQL', max_length=40)),
+                ('normalized_sql', models.TextField(help_text='SQL with literals and parameter lists collapsed')),
+                ('sql', models.TextField(help_text='SQL as executed')),
+                ('params', models.TextField(blank=True, help_text='Query parameters')),
+                ('duration_ms', models.FloatField(help_text='Execution time in milliseconds')),
+                ('call_site', models.CharField(help_text='Innermost project frame that issued the query', max_length=300)),
+                ('stack', models.TextField(help_text='Project frames of the Python stack, outermost first')),
+                ('view_name', models.CharField(blank=True, help_text='URL name of the request', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Slow Query',
+                'verbose_name_plural': 'Slow Queries',
+                'db_table': 'slowquery',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
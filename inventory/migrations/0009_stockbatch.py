@@ -0,0 +1,80 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:28
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_batches(apps, schema_editor):
+    """Replay the ledger per product in date order, the way StockBatch.rebuild() does"""
+    StckDetail = apps.get_model('inventory', 'StckDetail')
+    StockBatch = apps.get_model('inventory', 'StockBatch')
+
+    def fefo_key(batch):
+        return (batch.expiry_date is None, batch.expiry_date or date.max, batch.batch_number)
+
+    batches = {}
+    rows = StckDetail.objects.order_by('product', 'transaction_date', 'id').values_list(
+        'product_id', 'batch_number', 'expiry_date', 'signed_quantity'
+    )
+    for product_id, batch_number, expiry_date, signed_quantity in rows.iterator(chunk_size=2000):
+        product_batches = batches.setdefault(product_id, {})
+        batch_number = batch_number or ''
+        if signed_quantity >= 0:
+            batch = product_batches.get(batch_number)
+            if batch is None:
+                batch = product_batches[batch_number] = StockBatch(
+                    product_id=product_id, batch_number=batch_number, quantity=0
+                )
+            batch.quantity += signed_quantity
+            if batch.expiry_date is None:
+                batch.expiry_date = expiry_date
+            continue
+
+        needed = -signed_quantity
+        own = product_batches.get(batch_number) if batch_number else None
+        candidates = sorted(
+            (batch for batch in product_batches.values() if batch.quantity > 0 and batch is not own),
+            key=fefo_key
+        )
+        if own is not None and own.quantity > 0:
+            candidates.insert(0, own)
+        for batch in candidates:
+            taken = min(needed, batch.quantity)
+            batch.quantity -= taken
+            needed -= taken
+
+    StockBatch.objects.bulk_create(
+        [batch for product_batches in batches.values() for batch in product_batches.values()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(blank=True, help_text='Batch/Lot number', max_length=50)),
+                ('expiry_date', models.DateField(blank=True, help_text='Expiry date if applicable', null=True)),
+                ('quantity', models.IntegerField(default=0, help_text='Remaining quantity')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(help_text='Product this batch belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='inventory.prodmast')),
+            ],
+            options={
+                'verbose_name': 'Stock Batch',
+                'verbose_name_plural': 'Stock Batches',
+                'db_table': 'stckbatch',
+                'indexes': [models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='stckbatch_expiry_idx'), models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', 'expiry_date'], name='stckbatch_fefo_idx')],
+                'unique_together': {('product', 'batch_number')},
+            },
+        ),
+        migrations.RunPython(populate_batches, migrations.RunPython.noop),
+    ]
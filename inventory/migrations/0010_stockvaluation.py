@@ -0,0 +1,144 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:32
+
+from collections import deque
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_valuation(apps, schema_editor):
+    """Replay the ledger per product in date order, the way StockValuation.rebuild() does"""
+    StckDetail = apps.get_model('inventory', 'StckDetail')
+    StockValuation = apps.get_model('inventory', 'StockValuation')
+    CostLayer = apps.get_model('inventory', 'CostLayer')
+    ValuationEntry = apps.get_model('inventory', 'ValuationEntry')
+
+    valuations = []
+    layers = []
+    entries = []
+    valuation = None
+    open_layers = deque()
+    rows = StckDetail.objects.order_by('product', 'transaction_date', 'id').values_list(
+        'id', 'product_id', 'transaction_date', 'signed_quantity', 'unit_price'
+    )
+    for detail_id, product_id, transaction_date, signed_quantity, unit_price in rows.iterator(chunk_size=2000):
+        if valuation is None or product_id != valuation.product_id:
+            layers.extend(open_layers)
+            open_layers = deque()
+            valuation = StockValuation(
+                product_id=product_id, quantity=0,
+                average_cost=Decimal(0), average_value=Decimal(0), fifo_value=Decimal(0)
+            )
+            valuations.append(valuation)
+
+        if signed_quantity >= 0:
+            cost = unit_price.quantize(Decimal('0.01'))
+            owed = min(signed_quantity, max(-valuation.quantity, 0))
+            valuation.quantity += signed_quantity
+            valuation.average_value += cost * signed_quantity
+            if valuation.quantity > 0:
+                valuation.average_cost = (valuation.average_value / valuation.quantity).quantize(Decimal('0.0001'))
+            else:
+                valuation.average_cost = cost
+                valuation.average_value = cost * valuation.quantity
+            if signed_quantity > owed:
+                layer = CostLayer(
+                    product_id=product_id, detail_id=detail_id, received_at=transaction_date,
+                    unit_cost=cost, quantity=signed_quantity, remaining=signed_quantity - owed
+                )
+                open_layers.append(layer)
+                valuation.fifo_value += cost * layer.remaining
+        else:
+            needed = -signed_quantity
+            valuation.quantity += signed_quantity
+            valuation.average_value -= valuation.average_cost * needed
+            while needed and open_layers:
+                layer = open_layers[0]
+                taken = min(needed, layer.remaining)
+                layer.remaining -= taken
+                needed -= taken
+                valuation.fifo_value -= layer.unit_cost * taken
+                if not layer.remaining:
+                    open_layers.popleft()
+            if valuation.quantity == 0:
+                valuation.average_value = Decimal(0)
+
+        valuation.valued_through = transaction_date
+        entries.append(ValuationEntry(
+            detail_id=detail_id, product_id=product_id, transaction_date=transaction_date,
+            quantity=valuation.quantity, average_cost=valuation.average_cost,
+            average_value=valuation.average_value, fifo_value=valuation.fifo_value
+        ))
+        if len(entries) >= 1000:
+            ValuationEntry.objects.bulk_create(entries)
+            entries = []
+    layers.extend(open_layers)
+
+    ValuationEntry.objects.bulk_create(entries, batch_size=1000)
+    CostLayer.objects.bulk_create(layers, batch_size=1000)
+    StockValuation.objects.bulk_create(valuations, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stockbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('product', models.OneToOneField(help_text='Product this valuation belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation', serialize=False, to='inventory.prodmast')),
+                ('quantity', models.IntegerField(default=0, help_text='On-hand quantity')),
+                ('average_cost', models.DecimalField(decimal_places=4, default=0, help_text='Weighted-average unit cost', max_digits=14)),
+                ('average_value', models.DecimalField(decimal_places=4, default=0, help_text='Value at average cost', max_digits=18)),
+                ('fifo_value', models.DecimalField(decimal_places=4, default=0, help_text='Value of the open FIFO layers', max_digits=18)),
+                ('valued_through', models.DateTimeField(blank=True, help_text='Transaction date of the last line valued', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Valuation',
+                'verbose_name_plural': 'Stock Valuations',
+                'db_table': 'stckvaluation',
+            },
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_at', models.DateTimeField(help_text='Transaction date of the receipt')),
+                ('unit_cost', models.DecimalField(decimal_places=2, help_text='Unit cost of the receipt', max_digits=10)),
+                ('quantity', models.PositiveIntegerField(help_text='Quantity received')),
+                ('remaining', models.PositiveIntegerField(help_text='Quantity not yet issued')),
+                ('detail', models.OneToOneField(help_text='Receipt line the layer comes from', on_delete=django.db.models.deletion.CASCADE, related_name='cost_layer', to='inventory.stckdetail')),
+                ('product', models.ForeignKey(help_text='Product this layer belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='inventory.prodmast')),
+            ],
+            options={
+                'verbose_name': 'Cost Layer',
+                'verbose_name_plural': 'Cost Layers',
+                'db_table': 'stcklayer',
+                'indexes': [models.Index(fields=['product', 'received_at', 'detail'], name='stcklayer_fifo_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ValuationEntry',
+            fields=[
+                ('detail', models.OneToOneField(help_text='Ledger line this entry follows', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation_entry', serialize=False, to='inventory.stckdetail')),
+                ('transaction_date', models.DateTimeField(help_text='Copy of the transaction date')),
+                ('quantity', models.IntegerField(help_text='On-hand quantity')),
+                ('average_cost', models.DecimalField(decimal_places=4, help_text='Weighted-average unit cost', max_digits=14)),
+                ('average_value', models.DecimalField(decimal_places=4, help_text='Value at average cost', max_digits=18)),
+                ('fifo_value', models.DecimalField(decimal_places=4, help_text='Value of the open FIFO layers', max_digits=18)),
+                ('product', models.ForeignKey(help_text='Product this entry belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='valuation_entries', to='inventory.prodmast')),
+            ],
+            options={
+                'verbose_name': 'Valuation Entry',
+                'verbose_name_plural': 'Valuation Entries',
+                'db_table': 'stckvalentry',
+                'indexes': [models.Index(fields=['product', 'transaction_date', 'detail'], name='stckvalentry_asof_idx')],
+            },
+        ),
+        migrations.RunPython(populate_valuation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:39
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_stockvaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(help_text='Quantity held', validators=[django.core.validators.MinValueValidator(1)])),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('CONSUMED', 'Consumed'), ('RELEASED', 'Released')], default='ACTIVE', help_text='Reservation status', max_length=8)),
+                ('reference', models.CharField(blank=True, help_text='Order or pick list the stock is held for', max_length=100)),
+                ('created_by', models.CharField(help_text='User who created the reservation', max_length=100)),
+                ('expires_at', models.DateTimeField(help_text='The hold lapses at this time unless consumed or released')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(help_text='Product the stock is held of', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.prodmast')),
+            ],
+            options={
+                'verbose_name': 'Stock Reservation',
+                'verbose_name_plural': 'Stock Reservations',
+                'db_table': 'stckreservation',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['product', 'expires_at'], name='stckreservation_held_idx')],
+            },
+        ),
+    ]
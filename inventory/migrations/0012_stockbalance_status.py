@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:43
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, OuterRef, Subquery, Value, When
+
+
+def populate_status(apps, schema_editor):
+    """Give every product a balance row and set its status, the way StockBalance.refresh_status() does"""
+    ProdMast = apps.get_model('inventory', 'ProdMast')
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+
+    missing = ProdMast.objects.filter(balance__isnull=True).values_list('id', flat=True)
+    StockBalance.objects.bulk_create(
+        [StockBalance(product_id=product_id) for product_id in missing.iterator(chunk_size=2000)],
+        batch_size=1000
+    )
+    minimum_stock = Subquery(ProdMast.objects.filter(pk=OuterRef('product_id')).values('minimum_stock')[:1])
+    StockBalance.objects.update(status=Case(
+        When(quantity__lte=0, then=Value('OUT')),
+        When(quantity__lte=minimum_stock, then=Value('LOW')),
+        default=Value('IN'),
+        output_field=CharField()
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockbalance',
+            name='status',
+            field=models.CharField(choices=[('IN', 'In Stock'), ('LOW', 'Low Stock'), ('OUT', 'Out of Stock')], default='OUT', help_text="Stock status against the product's minimum stock", max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='stockbalance',
+            index=models.Index(fields=['status', 'product'], name='stckbalance_status_idx'),
+        ),
+        migrations.RunPython(populate_status, migrations.RunPython.noop),
+    ]
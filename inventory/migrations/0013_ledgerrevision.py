@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:18
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_revision(apps, schema_editor):
+    """Create the single counters row, starting from the latest movement already written"""
+    LedgerRevision = apps.get_model('inventory', 'LedgerRevision')
+    StckDetail = apps.get_model('inventory', 'StckDetail')
+    LedgerRevision.objects.create(
+        pk=1,
+        latest_movement_date=StckDetail.objects.aggregate(latest=Max('transaction_date'))['latest']
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stockbalance_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveBigIntegerField(default=0, help_text='Incremented on every stock or product change')),
+                ('history_revision', models.PositiveBigIntegerField(default=0, help_text='Incremented on back-dated movements, edits, deletes and product changes')),
+                ('latest_movement_date', models.DateTimeField(blank=True, help_text='Latest transaction date written', null=True)),
+                ('backdated_from', models.DateTimeField(blank=True, help_text='Earliest transaction date reached by a back-dated movement, edit or delete', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ledger Revision',
+                'verbose_name_plural': 'Ledger Revisions',
+                'db_table': 'ledgerrevision',
+            },
+        ),
+        migrations.RunPython(create_revision, migrations.RunPython.noop),
+    ]
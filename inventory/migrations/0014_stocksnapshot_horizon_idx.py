@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_ledgerrevision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['period', 'period_end'], name='stcksnapshot_horizon_idx'),
+        ),
+    ]
@@ -1,6 +1,156 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import (
+    CharField, Case, Count, F, IntegerField, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from bisect import insort
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from .caching import warm_after_commit
+
+CENT = Decimal('0.01')
+# Precision of average costs; values are exact sums of quantity x cost
+COST_PLACES = Decimal('0.0001')
+
+
+def insert_sql(model, field_names):
+    """INSERT statement for the given fields of model, for executemany()"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    return f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+
+def insert_rows(model, field_names, rows):
+    """Insert tuples of database-ready values with one executemany().
+
+    Replays of the whole ledger write a row per line; building and preparing
+    a model instance for each in bulk_create() would cost more than the replay.
+    """
+    if rows:
+        # One transaction, or autocommit would commit every row on its own
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(insert_sql(model, field_names), rows)
+
+
+@contextmanager
+def stock_check_atomic():
+    """transaction.atomic() for code that checks stock and then writes based on it.
+
+    SQLite has no row locks and ignores SELECT ... FOR UPDATE, so there the
+    transaction takes the database write lock when it starts (BEGIN IMMEDIATE).
+    Otherwise a concurrent writer would make it fail with "database is locked"
+    when it moves from reading to writing. Other backends lock the rows read
+    with select_for_update() and start the transaction as usual.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # An enclosing transaction has already started in its own mode
+        with transaction.atomic():
+            yield
+        return
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+class ProdMastQuerySet(models.QuerySet):
+    def delete(self):
+        # Bulk deletes (querysets and the admin action) skip ProdMast.delete()
+        result = super().delete()
+        if result[0]:
+            LedgerRevision.record()
+            warm_after_commit()
+        return result
+
+    def with_stock(self):
+        """Annotate stock_level, last_movement_date and stock_status in the same SQL statement"""
+        return self.annotate(
+            stock_level=Coalesce(F('balance__quantity'), Value(0)),
+            last_movement_date=F('balance__last_movement_at'),
+        ).annotate(
+            stock_status=Case(
+                When(stock_level__lte=0, then=Value('Out of Stock')),
+                When(stock_level__lte=F('minimum_stock'), then=Value('Low Stock')),
+                default=Value('In Stock'),
+                output_field=CharField()
+            )
+        )
+
+    def with_stock_at(self, target_date):
+        """Annotate historical_stock, historical_status and the last movement on or before target_date.
+
+        Every product is resolved in one SELECT: each row starts from its nearest
+        snapshot and adds a correlated grouped SUM of the movements after it.
+        """
+        snapshots = StockSnapshot.objects.filter(
+            product=OuterRef('pk'),
+            period_end__lte=target_date
+        ).order_by('-period_end')
+        movements = StckDetail.objects.filter(
+            product=OuterRef('pk'),
+            transaction_date__lte=target_date
+        )
+        window = movements.filter(
+            transaction_date__gte=OuterRef('window_start')
+        ).values('product').annotate(total=Sum('signed_quantity')).values('total')
+        last_movement = movements.order_by('-transaction_date')
+
+        return self.annotate(
+            snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), Value(0)),
+            window_start=Coalesce(
+                Subquery(snapshots.values('period_end')[:1]),
+                Value(datetime(1900, 1, 1, tzinfo=dt_timezone.utc))
+            ),
+        ).annotate(
+            historical_stock=F('snapshot_quantity') + Coalesce(Subquery(window), Value(0)),
+            last_movement_before=Subquery(last_movement.values('transaction_date')[:1]),
+            last_movement_type_before=Subquery(last_movement.values('stck_main__transaction_type')[:1]),
+        ).annotate(
+            historical_status=Case(
+                When(historical_stock__lte=0, then=Value('Out of Stock')),
+                When(historical_stock__lte=F('minimum_stock'), then=Value('Low Stock')),
+                default=Value('In Stock'),
+                output_field=CharField()
+            )
+        )
+
+    def stock_series(self, start, end, step):
+        """Return {product_id: [(timestamp, stock), ...]} at every step boundary from start to end.
+
+        Opening balances come from with_stock_at(start); the movements in the
+        window are then read once, in date order, and accumulated.
+        """
+        running = dict(self.with_stock_at(start).values_list('id', 'historical_stock'))
+        series = {product_id: [(start, stock)] for product_id, stock in running.items()}
+        movements = StckDetail.objects.filter(
+            product_id__in=list(running),
+            transaction_date__gt=start,
+            transaction_date__lte=end
+        ).order_by('transaction_date').values_list('product_id', 'signed_quantity', 'transaction_date')
+
+        boundary = start + step
+        for product_id, signed_quantity, transaction_date in movements.iterator(chunk_size=2000):
+            while transaction_date > boundary and boundary <= end:
+                for product_series_id, stock in running.items():
+                    series[product_series_id].append((boundary, stock))
+                boundary += step
+            running[product_id] += signed_quantity
+        while boundary <= end:
+            for product_id, stock in running.items():
+                series[product_id].append((boundary, stock))
+            boundary += step
+        return series
 
 
 class ProdMast(models.Model):
@@ -20,6 +170,8 @@ class ProdMast(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    objects = ProdMastQuerySet.as_manager()
+
     class Meta:
         db_table = 'prodmast'
         verbose_name = 'Product Master'
@@ -28,38 +180,66 @@ class ProdMast(models.Model):
     def __str__(self):
         return f"{self.product_code} - {self.product_name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # New products start out of stock, and minimum_stock changes can move the status
+        StockBalance.refresh_status([self.id])
+        LedgerRevision.record_history_change()
+        warm_after_commit()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        # Deleting a product deletes its movements too
+        LedgerRevision.record()
+        warm_after_commit()
+        return result
+
     @property
     def current_stock(self):
-        """Calculate current stock from all transactions"""
-        from django.db.models import Sum
-        stock_in = StckDetail.objects.filter(
-            product=self,
-            stck_main__transaction_type='IN'
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        stock_out = StckDetail.objects.filter(
-            product=self,
-            stck_main__transaction_type='OUT'
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        return stock_in - stock_out
+        """Current stock read from the materialized balance row"""
+        if 'stock_level' in self.__dict__:
+            # Already annotated by ProdMast.objects.with_stock()
+            return self.stock_level
+        try:
+            return self.balance.quantity
+        except StockBalance.DoesNotExist:
+            return 0
 
     def stock_at_date(self, target_date):
-        """Calculate stock as it was at a specific date and time"""
-        from django.db.models import Sum
-        stock_in = StckDetail.objects.filter(
+        """Calculate stock as it was at a specific date and time.
+
+        Starts from the nearest closing-balance snapshot before target_date and
+        only sums the movements recorded after it.
+        """
+        snapshot = StockSnapshot.objects.filter(
             product=self,
-            stck_main__transaction_type='IN',
-            stck_main__transaction_date__lte=target_date
-        ).aggregate(total=Sum('quantity'))['total'] or 0
+            period_end__lte=target_date
+        ).order_by('-period_end').first()
         
-        stock_out = StckDetail.objects.filter(
+        movements = StckDetail.objects.filter(
             product=self,
-            stck_main__transaction_type='OUT',
-            stck_main__transaction_date__lte=target_date
-        ).aggregate(total=Sum('quantity'))['total'] or 0
+            transaction_date__lte=target_date
+        )
+        if snapshot:
+            movements = movements.filter(transaction_date__gte=snapshot.period_end)
         
-        return stock_in - stock_out
+        base = snapshot.quantity if snapshot else 0
+        return base + (movements.aggregate(total=Sum('signed_quantity'))['total'] or 0)
+
+
+class StckMainQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate details_count and details_quantity so total_items/total_quantity need no extra query"""
+        return self.annotate(
+            details_count=Count('details'),
+            details_quantity=Coalesce(Sum('details__quantity'), Value(0))
+        )
+
+    def with_details(self):
+        """Prefetch the detail lines together with their products"""
+        return self.prefetch_related(
+            Prefetch('details', queryset=StckDetail.objects.select_related('product'))
+        )
 
 
 class StckMain(models.Model):
@@ -69,6 +249,9 @@ class StckMain(models.Model):
         ('OUT', 'Stock Out'),
         ('ADJ', 'Adjustment'),
     ]
+    # Direction in which each transaction type moves the on-hand balance.
+    # Adjustments carry a positive quantity and add to stock.
+    STOCK_SIGNS = {'IN': 1, 'OUT': -1, 'ADJ': 1}
     
     transaction_id = models.CharField(max_length=50, unique=True, help_text="Unique transaction ID")
     transaction_date = models.DateTimeField(help_text="Transaction date and time")
@@ -83,24 +266,55 @@ class StckMain(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = StckMainQuerySet.as_manager()
+
     class Meta:
         db_table = 'stckmain'
         verbose_name = 'Stock Transaction'
         verbose_name_plural = 'Stock Transactions'
         ordering = ['-transaction_date']
+        indexes = [
+            # Keyset pagination of the transaction list
+            models.Index(fields=['transaction_date', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.transaction_id} - {self.get_transaction_type_display()}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # The lines carry copies of the type and date, which must follow every header write
+            self.sync_details()
+
+    def signed(self, quantity):
+        """Return quantity with the sign this transaction applies to stock"""
+        return self.STOCK_SIGNS.get(self.transaction_type, 0) * quantity
+
+    def sync_details(self):
+        """Re-copy the transaction date and signed quantities onto the detail lines.
+
+        save() calls this for existing transactions; queryset update() skips it.
+        """
+        self.details.update(
+            transaction_date=self.transaction_date,
+            signed_quantity=self.STOCK_SIGNS.get(self.transaction_type, 0) * F('quantity')
+        )
+
     @property
     def total_items(self):
         """Get total number of items in this transaction"""
+        if 'details_count' in self.__dict__:
+            # Already annotated by StckMain.objects.with_totals()
+            return self.details_count
         return self.details.count()
 
     @property
     def total_quantity(self):
         """Get total quantity in this transaction"""
-        from django.db.models import Sum
+        if 'details_quantity' in self.__dict__:
+            return self.details_quantity
         return self.details.aggregate(total=Sum('quantity'))['total'] or 0
 
 
@@ -131,6 +345,12 @@ class StckDetail(models.Model):
     batch_number = models.CharField(max_length=50, blank=True, help_text="Batch/Lot number")
     expiry_date = models.DateField(null=True, blank=True, help_text="Expiry date if applicable")
     remarks = models.TextField(blank=True, help_text="Item-specific remarks")
+    # Denormalized from stck_main so stock aggregates never join stckmain
+    signed_quantity = models.IntegerField(
+        default=0,
+        help_text="Quantity with the sign of the transaction type (negative for stock out)"
+    )
+    transaction_date = models.DateTimeField(help_text="Copy of the transaction date")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -138,10 +358,29 @@ class StckDetail(models.Model):
         verbose_name = 'Stock Detail'
         verbose_name_plural = 'Stock Details'
         unique_together = ['stck_main', 'product']  # Prevent duplicate products in same transaction
+        indexes = [
+            # Keyset pagination of a product's movements
+            models.Index(fields=['product', 'created_at', 'id']),
+            # Balance and point-in-time SUMs over one product
+            models.Index(fields=['product', 'transaction_date']),
+            models.Index(fields=['transaction_date']),
+        ]
 
     def __str__(self):
         return f"{self.product.product_code} - {self.quantity} {self.product.unit}"
 
+    def save(self, *args, **kwargs):
+        self.sync_from_main()
+        super().save(*args, **kwargs)
+
+    def sync_from_main(self):
+        """Copy the signed quantity and transaction date from the parent transaction.
+
+        bulk_create() skips save(), so bulk write paths must call this themselves.
+        """
+        self.signed_quantity = self.stck_main.signed(self.quantity)
+        self.transaction_date = self.stck_main.transaction_date
+
     @property
     def total_value(self):
         """Calculate total value of this line item"""
@@ -149,8 +388,6 @@ class StckDetail(models.Model):
 
     def clean(self):
         """Custom validation"""
-        from django.core.exceptions import ValidationError
-        
         # For stock out transactions, check if enough stock is available
         if self.stck_main.transaction_type == 'OUT':
             current_stock = self.product.current_stock
@@ -159,3 +396,1031 @@ class StckDetail(models.Model):
                     f'Insufficient stock for {self.product.product_name}. '
                     f'Available: {current_stock}, Requested: {self.quantity}'
                 )
+
+
+class StockBalance(models.Model):
+    """Stock Balance - stores the on-hand quantity and stock status of each product, maintained on every movement.
+
+    The status is indexed, so low and out of stock products are read without
+    looking at the rest of the catalog. Every product gets a row when it is
+    created, and the status follows both movements and minimum_stock changes.
+    """
+    IN_STOCK = 'IN'
+    LOW_STOCK = 'LOW'
+    OUT_OF_STOCK = 'OUT'
+    STATUS_CHOICES = [
+        (IN_STOCK, 'In Stock'),
+        (LOW_STOCK, 'Low Stock'),
+        (OUT_OF_STOCK, 'Out of Stock'),
+    ]
+
+    product = models.OneToOneField(
+        ProdMast,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='balance',
+        help_text="Product this balance belongs to"
+    )
+    quantity = models.IntegerField(default=0, help_text="On-hand quantity")
+    last_movement_at = models.DateTimeField(null=True, blank=True, help_text="Time of the last movement")
+    version = models.PositiveIntegerField(default=0, help_text="Incremented on every change")
+    status = models.CharField(
+        max_length=3,
+        choices=STATUS_CHOICES,
+        default=OUT_OF_STOCK,
+        help_text="Stock status against the product's minimum stock"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckbalance'
+        verbose_name = 'Stock Balance'
+        verbose_name_plural = 'Stock Balances'
+        indexes = [
+            models.Index(fields=['status', 'product'], name='stckbalance_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity}"
+
+    @classmethod
+    def status_for(cls, quantity, minimum_stock):
+        """Same rule as the stock_status of ProdMast.objects.with_stock()"""
+        if quantity <= 0:
+            return cls.OUT_OF_STOCK
+        if quantity <= minimum_stock:
+            return cls.LOW_STOCK
+        return cls.IN_STOCK
+
+    @classmethod
+    def status_expression(cls):
+        """SQL form of status_for() over the stored quantity, for UPDATE statements"""
+        minimum_stock = Subquery(ProdMast.objects.filter(pk=OuterRef('product_id')).values('minimum_stock')[:1])
+        return Case(
+            When(quantity__lte=0, then=Value(cls.OUT_OF_STOCK)),
+            When(quantity__lte=minimum_stock, then=Value(cls.LOW_STOCK)),
+            default=Value(cls.IN_STOCK),
+            output_field=CharField()
+        )
+
+    @classmethod
+    def refresh_status(cls, product_ids):
+        """Create missing balance rows for the given products and recompute their status"""
+        cls.objects.bulk_create([cls(product_id=product_id) for product_id in product_ids], ignore_conflicts=True)
+        cls.objects.filter(product_id__in=product_ids).update(status=cls.status_expression())
+
+    @classmethod
+    def alerts(cls, status):
+        """Active products with the given status, read through the status index"""
+        return ProdMast.objects.with_stock().filter(
+            balance__status=status,
+            is_active=True
+        ).order_by('id')
+
+    @classmethod
+    def apply_movements(cls, deltas, moved_at=None):
+        """Add signed quantity deltas ({product_id: delta}) to the balances in one UPDATE.
+
+        Must be called inside the transaction that writes the ledger rows.
+        """
+        if not deltas:
+            return
+        moved_at = moved_at or timezone.now()
+        cls.objects.bulk_create(
+            [cls(product_id=product_id) for product_id in deltas],
+            ignore_conflicts=True
+        )
+        cls.objects.filter(product_id__in=deltas).update(
+            quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            ),
+            last_movement_at=moved_at,
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        # SET expressions see the old quantity, so the status follows in a second UPDATE of the same rows
+        cls.objects.filter(product_id__in=deltas).update(status=cls.status_expression())
+        warm_after_commit()
+
+    @classmethod
+    def rebuild(cls, product_ids=None):
+        """Recompute balances and statuses from the ledger. Returns the number of rows that had drifted."""
+        products = ProdMast.objects.all()
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+
+        ledger = StckDetail.objects.filter(product__in=products).values('product').annotate(
+            total=Sum('signed_quantity'),
+            last_movement_at=Max('created_at')
+        )
+        expected = {row['product']: (row['total'] or 0, row['last_movement_at']) for row in ledger}
+        existing = {balance.product_id: balance for balance in cls.objects.filter(product__in=products)}
+
+        drifted = 0
+        to_create = []
+        to_update = []
+        for product_id, minimum_stock in products.values_list('id', 'minimum_stock'):
+            quantity, last_movement_at = expected.get(product_id, (0, None))
+            status = cls.status_for(quantity, minimum_stock)
+            balance = existing.get(product_id)
+            if balance is None:
+                to_create.append(cls(
+                    product_id=product_id,
+                    quantity=quantity,
+                    last_movement_at=last_movement_at,
+                    status=status
+                ))
+                drifted += quantity != 0
+            elif (balance.quantity, balance.last_movement_at, balance.status) != (quantity, last_movement_at, status):
+                balance.quantity = quantity
+                balance.last_movement_at = last_movement_at
+                balance.status = status
+                balance.version += 1
+                balance.updated_at = timezone.now()
+                to_update.append(balance)
+                drifted += 1
+
+        cls.objects.bulk_create(to_create, batch_size=1000)
+        cls.objects.bulk_update(
+            to_update, ['quantity', 'last_movement_at', 'status', 'version', 'updated_at'], batch_size=1000
+        )
+        if to_create or to_update:
+            # The corrected rows are new current stock, under a new ledger revision
+            LedgerRevision.record_stock_change()
+            warm_after_commit()
+        return drifted
+
+
+class StockSnapshot(models.Model):
+    """Stock Snapshot - stores the closing balance of a product at the end of a period.
+
+    Rows are only written for periods in which the product moved, so the
+    closing balance at any boundary is the nearest snapshot at or before it.
+    """
+    PERIODS = [
+        ('day', 'Daily'),
+        ('month', 'Monthly'),
+    ]
+
+    product = models.ForeignKey(
+        ProdMast,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        help_text="Product this snapshot belongs to"
+    )
+    period = models.CharField(max_length=5, choices=PERIODS, help_text="Snapshot interval")
+    period_end = models.DateTimeField(help_text="Closing boundary; includes movements dated before it")
+    quantity = models.IntegerField(help_text="Closing balance at period_end")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    INSERT_FIELDS = ['product', 'period', 'period_end', 'quantity', 'created_at']
+
+    class Meta:
+        db_table = 'stcksnapshot'
+        verbose_name = 'Stock Snapshot'
+        verbose_name_plural = 'Stock Snapshots'
+        unique_together = ['product', 'period', 'period_end']
+        indexes = [
+            models.Index(fields=['product', 'period_end']),
+            # The build horizon of each period
+            models.Index(fields=['period', 'period_end'], name='stcksnapshot_horizon_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.period_end} - {self.quantity}"
+
+    @staticmethod
+    def period_start(value, period):
+        """Truncate a datetime to the start of its period"""
+        value = timezone.localtime(value)
+        value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == 'month':
+            value = value.replace(day=1)
+        return value
+
+    @staticmethod
+    def next_boundary(period_start, period):
+        """Return the start of the period following period_start"""
+        if period == 'month':
+            return (period_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return period_start + timedelta(days=1)
+
+    @classmethod
+    def apply_movements(cls, deltas, transaction_date):
+        """Add signed quantity deltas to every snapshot a (possibly back-dated) movement falls into.
+
+        A back-dated movement in an already built period the product did not
+        move in first gets that period's row, carried forward from the previous
+        one, so the period keeps a closing balance for later builds to start from.
+        Movements dated after the last built boundary touch no rows.
+        """
+        if not deltas:
+            return
+        for period, _label in cls.PERIODS:
+            period_end = cls.next_boundary(cls.period_start(transaction_date, period), period)
+            horizon = cls.objects.filter(period=period).aggregate(horizon=Max('period_end'))['horizon']
+            if horizon is None or period_end > horizon:
+                continue
+            existing = set(cls.objects.filter(
+                product_id__in=deltas, period=period, period_end=period_end
+            ).values_list('product_id', flat=True))
+            missing = [product_id for product_id in deltas if product_id not in existing]
+            if missing:
+                openings = ProdMast.objects.filter(id__in=missing).annotate(
+                    opening=Subquery(
+                        cls.objects.filter(product=OuterRef('pk'), period=period, period_end__lt=period_end)
+                        .order_by('-period_end').values('quantity')[:1]
+                    )
+                ).values_list('id', 'opening')
+                # The UPDATE below adds the movement itself
+                cls.objects.bulk_create([
+                    cls(product_id=product_id, period=period, period_end=period_end, quantity=opening or 0)
+                    for product_id, opening in openings
+                ])
+        cls.objects.filter(product_id__in=deltas, period_end__gt=transaction_date).update(
+            quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        )
+
+    @classmethod
+    def build(cls, period, until=None, batch_size=1000):
+        """Extend snapshots from the last built boundary to the start of the current period.
+
+        Returns the number of snapshot rows written.
+        """
+        start = cls.objects.filter(period=period).aggregate(horizon=Max('period_end'))['horizon']
+        end = cls.period_start(until or timezone.now(), period)
+        if start is not None and start >= end:
+            return 0
+
+        # Opening balances are the latest existing snapshot of each product
+        opening = {}
+        if start is not None:
+            opening = dict(
+                ProdMast.objects.annotate(
+                    opening=Subquery(
+                        cls.objects.filter(product=OuterRef('pk'), period=period)
+                        .order_by('-period_end').values('quantity')[:1]
+                    )
+                ).filter(opening__isnull=False).values_list('id', 'opening')
+            )
+        return cls._write(period, start, end, opening, batch_size=batch_size)
+
+    @classmethod
+    def rebuild(cls, period, product_ids=None, batch_size=1000):
+        """Drop and recompute snapshots up to the existing horizon, for all or some products"""
+        snapshots = cls.objects.filter(period=period)
+        horizon = snapshots.aggregate(horizon=Max('period_end'))['horizon']
+        if horizon is None:
+            return 0
+        if product_ids is not None:
+            snapshots = snapshots.filter(product_id__in=product_ids)
+        snapshots.delete()
+        return cls._write(period, None, horizon, {}, product_ids=product_ids, batch_size=batch_size)
+
+    @classmethod
+    def _write(cls, period, start, end, opening, product_ids=None, batch_size=1000):
+        """Write a snapshot for every (product, period) with movements between start and end"""
+        trunc = TruncMonth if period == 'month' else TruncDay
+        movements = StckDetail.objects.filter(transaction_date__lt=end)
+        if start is not None:
+            movements = movements.filter(transaction_date__gte=start)
+        if product_ids is not None:
+            movements = movements.filter(product_id__in=product_ids)
+        buckets = movements.annotate(
+            bucket=trunc('transaction_date')
+        ).values('product', 'bucket').annotate(
+            total=Sum('signed_quantity')
+        ).order_by('product', 'bucket')
+
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        now = adapt_datetime(timezone.now())
+        written = 0
+        batch = []
+        product_id = None
+        running = 0
+        for row in buckets.iterator(chunk_size=batch_size):
+            if row['product'] != product_id:
+                product_id = row['product']
+                running = opening.get(product_id, 0)
+            running += row['total'] or 0
+            batch.append((
+                product_id, period, adapt_datetime(cls.next_boundary(row['bucket'], period)), running, now
+            ))
+            if len(batch) >= batch_size:
+                insert_rows(cls, cls.INSERT_FIELDS, batch)
+                written += len(batch)
+                batch = []
+        insert_rows(cls, cls.INSERT_FIELDS, batch)
+        return written + len(batch)
+
+
+class _ProductBatches(dict):
+    """One product's {batch_number: StockBatch}, also keeping the batches with stock in FEFO order"""
+
+    def __init__(self):
+        super().__init__()
+        self.open = []
+
+    def add(self, batch):
+        self[batch.batch_number] = batch
+        if batch.quantity > 0:
+            insort(self.open, batch, key=StockBatch.fefo_key)
+
+
+class StockBatch(models.Model):
+    """Stock Batch - remaining quantity of each batch/lot of a product, maintained on every movement.
+
+    IN and ADJ lines add to their batch (lines without a batch number share the
+    '' batch). OUT lines take from their own batch first, if they name one, and
+    then from the other batches of the product, earliest expiry first. Batches
+    expired on the transaction date are only taken by OUT lines that name them.
+    """
+    product = models.ForeignKey(
+        ProdMast,
+        on_delete=models.CASCADE,
+        related_name='batches',
+        help_text="Product this batch belongs to"
+    )
+    batch_number = models.CharField(max_length=50, blank=True, help_text="Batch/Lot number")
+    expiry_date = models.DateField(null=True, blank=True, help_text="Expiry date if applicable")
+    quantity = models.IntegerField(default=0, help_text="Remaining quantity")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    INSERT_FIELDS = ['product', 'batch_number', 'expiry_date', 'quantity', 'updated_at']
+
+    class Meta:
+        db_table = 'stckbatch'
+        verbose_name = 'Stock Batch'
+        verbose_name_plural = 'Stock Batches'
+        unique_together = ['product', 'batch_number']
+        indexes = [
+            # Expiring stock across all products, and FEFO picking within one
+            models.Index(fields=['expiry_date'], condition=Q(quantity__gt=0), name='stckbatch_expiry_idx'),
+            models.Index(fields=['product', 'expiry_date'], condition=Q(quantity__gt=0), name='stckbatch_fefo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} / {self.batch_number or '-'} - {self.quantity}"
+
+    @staticmethod
+    def fefo_key(batch):
+        """Sort key picking the earliest expiry first and undated stock last"""
+        return (batch.expiry_date is None, batch.expiry_date or date.max, batch.batch_number)
+
+    @classmethod
+    def _apply_line(cls, batches, product_id, batch_number, expiry_date, signed_quantity, transaction_date):
+        """Apply one ledger line to a product's _ProductBatches; returns the batches it changed"""
+        batch_number = batch_number or ''
+        if signed_quantity >= 0:
+            batch = batches.get(batch_number)
+            if batch is None:
+                batch = cls(product_id=product_id, batch_number=batch_number)
+                batches.add(batch)
+            was_open = batch.quantity > 0
+            if batch.expiry_date is None and expiry_date is not None:
+                if was_open:
+                    # Its FEFO position changes with the expiry date
+                    batches.open.remove(batch)
+                    was_open = False
+                batch.expiry_date = expiry_date
+            batch.quantity += signed_quantity
+            if not was_open and batch.quantity > 0:
+                insort(batches.open, batch, key=cls.fefo_key)
+            return [batch]
+
+        needed = -signed_quantity
+        changed = []
+        own = batches.get(batch_number) if batch_number else None
+        if own is not None and own.quantity > 0:
+            taken = min(needed, own.quantity)
+            own.quantity -= taken
+            needed -= taken
+            changed.append(own)
+            if not own.quantity:
+                batches.open.remove(own)
+        issued_on = None
+        index = 0
+        while needed and index < len(batches.open):
+            batch = batches.open[index]
+            if batch.expiry_date is not None:
+                if issued_on is None:
+                    issued_on = timezone.localdate(transaction_date)
+                if batch.expiry_date < issued_on:
+                    # Expired stock stays on hand until it is written off by batch number
+                    index += 1
+                    continue
+            taken = min(needed, batch.quantity)
+            batch.quantity -= taken
+            needed -= taken
+            changed.append(batch)
+            if not batch.quantity:
+                batches.open.pop(index)
+        return changed
+
+    @classmethod
+    def apply_details(cls, details):
+        """Update remaining batch quantities for newly written detail lines"""
+        if not details:
+            return
+        product_ids = {detail.product_id for detail in details}
+        batch_numbers = {detail.batch_number or '' for detail in details}
+        batches = {}
+        for batch in cls.objects.select_for_update().filter(
+            Q(quantity__gt=0) | Q(batch_number__in=batch_numbers),
+            product_id__in=product_ids
+        ):
+            batches.setdefault(batch.product_id, _ProductBatches()).add(batch)
+
+        changed = {}
+        for detail in details:
+            for batch in cls._apply_line(
+                batches.setdefault(detail.product_id, _ProductBatches()), detail.product_id,
+                detail.batch_number, detail.expiry_date, detail.signed_quantity, detail.transaction_date
+            ):
+                changed[id(batch)] = batch
+
+        cls.objects.bulk_create([batch for batch in changed.values() if batch.pk is None], batch_size=1000)
+        cls.objects.bulk_update(
+            [batch for batch in changed.values() if batch.pk is not None],
+            ['quantity', 'expiry_date'],
+            batch_size=1000
+        )
+
+    @classmethod
+    def rebuild(cls, product_ids=None, batch_size=1000):
+        """Drop and replay the batches of all or some products from the ledger. Returns the rows written."""
+        batches = cls.objects.all()
+        movements = StckDetail.objects.all()
+        if product_ids is not None:
+            batches = batches.filter(product_id__in=product_ids)
+            movements = movements.filter(product_id__in=product_ids)
+        batches.delete()
+
+        # Each product's batches are written as soon as its lines are replayed
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        written = 0
+        rows = []
+        product_batches = _ProductBatches()
+        current_product = None
+        for product_id, batch_number, expiry_date, signed_quantity, transaction_date in movements.order_by(
+            'product', 'transaction_date', 'id'
+        ).values_list(
+            'product_id', 'batch_number', 'expiry_date', 'signed_quantity', 'transaction_date'
+        ).iterator(chunk_size=2000):
+            if product_id != current_product:
+                rows.extend(cls._rows(product_batches.values(), now))
+                product_batches = _ProductBatches()
+                current_product = product_id
+                if len(rows) >= batch_size:
+                    insert_rows(cls, cls.INSERT_FIELDS, rows)
+                    written += len(rows)
+                    rows = []
+            cls._apply_line(product_batches, product_id, batch_number, expiry_date, signed_quantity, transaction_date)
+        rows.extend(cls._rows(product_batches.values(), now))
+        insert_rows(cls, cls.INSERT_FIELDS, rows)
+        return written + len(rows)
+
+    @staticmethod
+    def _rows(batches, now):
+        adapt_date = connection.ops.adapt_datefield_value
+        return [
+            (batch.product_id, batch.batch_number, adapt_date(batch.expiry_date), batch.quantity, now)
+            for batch in batches
+        ]
+
+
+class StockValuation(models.Model):
+    """Stock Valuation - quantity and value of a product at weighted-average and at FIFO cost.
+
+    Maintained on every movement together with the product's open FIFO cost
+    layers and one ValuationEntry per ledger line. IN and ADJ lines are
+    received at their unit price. OUT lines are issued at the current average
+    cost and consume the oldest layers. Stock issued beyond what is on hand is
+    owed by the next receipts, so the open layers always add up to the
+    quantity on hand.
+    """
+    product = models.OneToOneField(
+        ProdMast,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='valuation',
+        help_text="Product this valuation belongs to"
+    )
+    quantity = models.IntegerField(default=0, help_text="On-hand quantity")
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4, default=0, help_text="Weighted-average unit cost")
+    average_value = models.DecimalField(max_digits=18, decimal_places=4, default=0, help_text="Value at average cost")
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4, default=0, help_text="Value of the open FIFO layers")
+    valued_through = models.DateTimeField(null=True, blank=True, help_text="Transaction date of the last line valued")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    FIELDS = ['quantity', 'average_cost', 'average_value', 'fifo_value', 'valued_through', 'updated_at']
+    INSERT_FIELDS = ['product'] + FIELDS
+
+    class Meta:
+        db_table = 'stckvaluation'
+        verbose_name = 'Stock Valuation'
+        verbose_name_plural = 'Stock Valuations'
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity} @ {self.average_cost}"
+
+    def _apply_line(self, layers, detail_id, transaction_date, signed_quantity, unit_price):
+        """Value one ledger line against the product's open layers, oldest first.
+
+        Returns the layers the line created or changed, and the values of its
+        ValuationEntry in ValuationEntry.INSERT_FIELDS order.
+        """
+        changed = []
+        if signed_quantity >= 0:
+            cost = Decimal(str(unit_price)).quantize(CENT)
+            # Units issued while out of stock are taken from this receipt first
+            owed = min(signed_quantity, max(-self.quantity, 0))
+            self.quantity += signed_quantity
+            self.average_value += cost * signed_quantity
+            if self.quantity > 0:
+                self.average_cost = (self.average_value / self.quantity).quantize(COST_PLACES)
+            else:
+                self.average_cost = cost
+                self.average_value = cost * self.quantity
+            if signed_quantity > owed:
+                layer = CostLayer(
+                    product_id=self.product_id,
+                    detail_id=detail_id,
+                    received_at=transaction_date,
+                    unit_cost=cost,
+                    quantity=signed_quantity,
+                    remaining=signed_quantity - owed
+                )
+                layers.append(layer)
+                changed.append(layer)
+                self.fifo_value += cost * layer.remaining
+        else:
+            needed = -signed_quantity
+            self.quantity += signed_quantity
+            self.average_value -= self.average_cost * needed
+            while needed and layers:
+                layer = layers[0]
+                taken = min(needed, layer.remaining)
+                layer.remaining -= taken
+                needed -= taken
+                self.fifo_value -= layer.unit_cost * taken
+                changed.append(layer)
+                if not layer.remaining:
+                    layers.popleft()
+            if self.quantity == 0:
+                # Drop the rounding left by the average cost
+                self.average_value = Decimal(0)
+
+        self.valued_through = transaction_date
+        entry = (
+            detail_id, self.product_id, transaction_date,
+            self.quantity, self.average_cost, self.average_value, self.fifo_value
+        )
+        return changed, entry
+
+    @classmethod
+    def apply_details(cls, details):
+        """Value newly written detail lines (with their IDs set) on top of the maintained state.
+
+        Products given a line dated before their last valued line are replayed
+        from the ledger instead, since it changes every value after it.
+        """
+        if not details:
+            return
+        product_ids = {detail.product_id for detail in details}
+        cls.objects.bulk_create([cls(product_id=product_id) for product_id in product_ids], ignore_conflicts=True)
+        valuations = {
+            valuation.product_id: valuation
+            for valuation in cls.objects.select_for_update().filter(product_id__in=product_ids)
+        }
+        replay = {
+            detail.product_id for detail in details
+            if valuations[detail.product_id].valued_through is not None
+            and detail.transaction_date < valuations[detail.product_id].valued_through
+        }
+        details = sorted(
+            (detail for detail in details if detail.product_id not in replay),
+            key=lambda detail: (detail.transaction_date, detail.pk)
+        )
+
+        layers = {}
+        for layer in CostLayer.objects.select_for_update().filter(
+            product_id__in={detail.product_id for detail in details}, remaining__gt=0
+        ).order_by('received_at', 'detail_id'):
+            layers.setdefault(layer.product_id, deque()).append(layer)
+
+        changed = {}
+        entries = []
+        for detail in details:
+            layers_changed, entry = valuations[detail.product_id]._apply_line(
+                layers.setdefault(detail.product_id, deque()), detail.pk,
+                detail.transaction_date, detail.signed_quantity, detail.unit_price
+            )
+            for layer in layers_changed:
+                changed[id(layer)] = layer
+            entries.append(entry)
+
+        CostLayer.objects.bulk_create(
+            [layer for layer in changed.values() if layer.pk is None and layer.remaining],
+            batch_size=1000
+        )
+        CostLayer.objects.filter(
+            pk__in=[layer.pk for layer in changed.values() if layer.pk is not None and not layer.remaining]
+        ).delete()
+        CostLayer.objects.bulk_update(
+            [layer for layer in changed.values() if layer.pk is not None and layer.remaining],
+            ['remaining'],
+            batch_size=1000
+        )
+        ValuationEntry.insert(entries)
+        now = timezone.now()
+        for valuation in valuations.values():
+            valuation.updated_at = now
+        cls.objects.bulk_update(
+            [valuations[product_id] for product_id in product_ids - replay], cls.FIELDS, batch_size=1000
+        )
+        if replay:
+            cls.rebuild(replay)
+
+    @classmethod
+    def rebuild(cls, product_ids=None, batch_size=1000):
+        """Drop and replay the valuation of all or some products from the ledger. Returns the products valued."""
+        movements = StckDetail.objects.all()
+        deleted = [cls.objects.all(), CostLayer.objects.all(), ValuationEntry.objects.all()]
+        if product_ids is not None:
+            movements = movements.filter(product_id__in=product_ids)
+            deleted = [queryset.filter(product_id__in=product_ids) for queryset in deleted]
+        for queryset in deleted:
+            queryset.delete()
+
+        # Products are replayed one at a time; only the current product's open
+        # layers are kept, and rows are written in batches as they complete.
+        now = timezone.now()
+        valued = 0
+        valuations = []
+        layers = []
+        entries = []
+        valuation = None
+        product_layers = deque()
+        for detail_id, product_id, transaction_date, signed_quantity, unit_price in movements.order_by(
+            'product', 'transaction_date', 'id'
+        ).values_list('id', 'product_id', 'transaction_date', 'signed_quantity', 'unit_price').iterator(chunk_size=2000):
+            if valuation is None or product_id != valuation.product_id:
+                if valuation is not None:
+                    valuations.append(valuation._row(now))
+                    layers.extend(CostLayer._row(layer) for layer in product_layers)
+                    valued += 1
+                if len(valuations) >= batch_size or len(layers) >= batch_size:
+                    insert_rows(cls, cls.INSERT_FIELDS, valuations)
+                    insert_rows(CostLayer, CostLayer.INSERT_FIELDS, layers)
+                    valuations = []
+                    layers = []
+                valuation = cls(product_id=product_id)
+                product_layers = deque()
+            _changed, entry = valuation._apply_line(
+                product_layers, detail_id, transaction_date, signed_quantity, unit_price
+            )
+            entries.append(entry)
+            if len(entries) >= batch_size:
+                ValuationEntry.insert(entries)
+                entries = []
+        if valuation is not None:
+            valuations.append(valuation._row(now))
+            layers.extend(CostLayer._row(layer) for layer in product_layers)
+            valued += 1
+
+        ValuationEntry.insert(entries)
+        insert_rows(CostLayer, CostLayer.INSERT_FIELDS, layers)
+        insert_rows(cls, cls.INSERT_FIELDS, valuations)
+        return valued
+
+    def _row(self, now):
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        return (
+            self.product_id, self.quantity, self.average_cost, self.average_value, self.fifo_value,
+            adapt_datetime(self.valued_through), adapt_datetime(now)
+        )
+
+
+class CostLayer(models.Model):
+    """Cost Layer - quantity still on hand from one receipt at its unit cost; layers are issued oldest first"""
+    product = models.ForeignKey(
+        ProdMast,
+        on_delete=models.CASCADE,
+        related_name='cost_layers',
+        help_text="Product this layer belongs to"
+    )
+    detail = models.OneToOneField(
+        StckDetail,
+        on_delete=models.CASCADE,
+        related_name='cost_layer',
+        help_text="Receipt line the layer comes from"
+    )
+    received_at = models.DateTimeField(help_text="Transaction date of the receipt")
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Unit cost of the receipt")
+    quantity = models.PositiveIntegerField(help_text="Quantity received")
+    remaining = models.PositiveIntegerField(help_text="Quantity not yet issued")
+
+    INSERT_FIELDS = ['product', 'detail', 'received_at', 'unit_cost', 'quantity', 'remaining']
+
+    class Meta:
+        db_table = 'stcklayer'
+        verbose_name = 'Cost Layer'
+        verbose_name_plural = 'Cost Layers'
+        indexes = [
+            models.Index(fields=['product', 'received_at', 'detail'], name='stcklayer_fifo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.remaining} @ {self.unit_cost}"
+
+    def _row(self):
+        return (
+            self.product_id, self.detail_id, connection.ops.adapt_datetimefield_value(self.received_at),
+            self.unit_cost, self.quantity, self.remaining
+        )
+
+
+class ValuationEntry(models.Model):
+    """Valuation Entry - quantity and values of a product right after one ledger line.
+
+    The valuation at any date is the latest entry of each product up to it.
+    """
+    detail = models.OneToOneField(
+        StckDetail,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='valuation_entry',
+        help_text="Ledger line this entry follows"
+    )
+    product = models.ForeignKey(
+        ProdMast,
+        on_delete=models.CASCADE,
+        related_name='valuation_entries',
+        help_text="Product this entry belongs to"
+    )
+    transaction_date = models.DateTimeField(help_text="Copy of the transaction date")
+    quantity = models.IntegerField(help_text="On-hand quantity")
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4, help_text="Weighted-average unit cost")
+    average_value = models.DecimalField(max_digits=18, decimal_places=4, help_text="Value at average cost")
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4, help_text="Value of the open FIFO layers")
+
+    INSERT_FIELDS = [
+        'detail', 'product', 'transaction_date', 'quantity', 'average_cost', 'average_value', 'fifo_value'
+    ]
+
+    class Meta:
+        db_table = 'stckvalentry'
+        verbose_name = 'Valuation Entry'
+        verbose_name_plural = 'Valuation Entries'
+        indexes = [
+            models.Index(fields=['product', 'transaction_date', 'detail'], name='stckvalentry_asof_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.transaction_date} - {self.quantity}"
+
+    @classmethod
+    def insert(cls, entries):
+        """Write entry values as returned by StockValuation._apply_line()"""
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        insert_rows(cls, cls.INSERT_FIELDS, [
+            (detail_id, product_id, adapt_datetime(transaction_date), quantity, average_cost, average_value, fifo_value)
+            for detail_id, product_id, transaction_date, quantity, average_cost, average_value, fifo_value in entries
+        ])
+
+
+class StockReservation(models.Model):
+    """Stock Reservation - a hold on a quantity of a product that counts against its available stock until it expires.
+
+    Reservations and stock-out movements check availability with the product's
+    balance row locked, so concurrent writers of one product queue up while
+    other products are not blocked.
+    """
+    STATUS_CHOICES = [
+        ('ACTIVE', 'Active'),
+        ('CONSUMED', 'Consumed'),
+        ('RELEASED', 'Released'),
+    ]
+
+    product = models.ForeignKey(
+        ProdMast,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text="Product the stock is held of"
+    )
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)], help_text="Quantity held")
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='ACTIVE', help_text="Reservation status")
+    reference = models.CharField(max_length=100, blank=True, help_text="Order or pick list the stock is held for")
+    created_by = models.CharField(max_length=100, help_text="User who created the reservation")
+    expires_at = models.DateTimeField(help_text="The hold lapses at this time unless consumed or released")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckreservation'
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+        ordering = ['-created_at']
+        indexes = [
+            # Quantity held per product
+            models.Index(fields=['product', 'expires_at'], condition=Q(status='ACTIVE'), name='stckreservation_held_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity} ({self.status})"
+
+    @property
+    def is_held(self):
+        return self.status == 'ACTIVE' and self.expires_at > timezone.now()
+
+    @classmethod
+    def held(cls, product_ids, exclude=()):
+        """Quantities held by unexpired active reservations ({product_id: quantity})"""
+        return dict(
+            cls.objects.filter(product_id__in=product_ids, status='ACTIVE', expires_at__gt=timezone.now())
+            .exclude(id__in=exclude)
+            .values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+        )
+
+    @classmethod
+    def lock_available(cls, product_ids, consuming=()):
+        """Lock the balance rows of the given products and return their unreserved stock ({product_id: quantity}).
+
+        Rows are locked in product order so writers never deadlock. Reservations
+        being consumed do not count against the stock. Must be called inside a
+        transaction; the result holds until it commits.
+        """
+        balances = dict(
+            StockBalance.objects.select_for_update().filter(product_id__in=product_ids)
+            .order_by('product_id').values_list('product_id', 'quantity')
+        )
+        held = cls.held(product_ids, exclude=consuming)
+        return {product_id: balances.get(product_id, 0) - held.get(product_id, 0) for product_id in product_ids}
+
+    @classmethod
+    def reserve(cls, product, quantity, expires_at, reference='', created_by=''):
+        """Hold stock of a product until expires_at. Raises ValidationError if not enough is available."""
+        with stock_check_atomic():
+            available = cls.lock_available([product.id])[product.id]
+            if quantity > available:
+                raise ValidationError(
+                    f'Insufficient stock for {product.product_name}. '
+                    f'Available: {available}, Requested: {quantity}'
+                )
+            return cls.objects.create(
+                product=product,
+                quantity=quantity,
+                expires_at=expires_at,
+                reference=reference,
+                created_by=created_by
+            )
+
+    def release(self):
+        """Give up the hold; returns False if it was already consumed or released"""
+        released = type(self).objects.filter(pk=self.pk, status='ACTIVE').update(
+            status='RELEASED', updated_at=timezone.now()
+        )
+        if released:
+            self.status = 'RELEASED'
+        return bool(released)
+
+
+class LedgerRevision(models.Model):
+    """Ledger Revision - a single row of counters bumped in the same transaction as every stock or product change.
+
+    Conditional GETs compare these counters instead of aggregating the ledger.
+    Movements dated before the latest one already written are back-dated: they
+    also bump history_revision and lower backdated_from, so history before
+    backdated_from has never been changed after it was first written.
+    """
+    # Transaction date standing for "any date", for changes whose dates are not known
+    BEGINNING = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+    revision = models.PositiveBigIntegerField(default=0, help_text="Incremented on every stock or product change")
+    history_revision = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Incremented on back-dated movements, edits, deletes and product changes"
+    )
+    latest_movement_date = models.DateTimeField(null=True, blank=True, help_text="Latest transaction date written")
+    backdated_from = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Earliest transaction date reached by a back-dated movement, edit or delete"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ledgerrevision'
+        verbose_name = 'Ledger Revision'
+        verbose_name_plural = 'Ledger Revisions'
+
+    def __str__(self):
+        return f"{self.revision} / {self.history_revision}"
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+    @classmethod
+    def _bump(cls, **changes):
+        changes.update(revision=F('revision') + 1, updated_at=timezone.now())
+        if not cls.objects.filter(pk=1).update(**changes):
+            # The row is created by the migration, but a flushed database has lost it
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(**changes)
+
+    @classmethod
+    def record(cls, earliest=None, latest=None):
+        """Count a ledger change whose lines are dated from earliest to latest.
+
+        Without earliest the change may have touched any date (edits, deletes
+        and rebuilds). Must be called inside the transaction that writes the ledger.
+        """
+        changes = {}
+        latest = latest or earliest
+        if latest:
+            changes['latest_movement_date'] = Case(
+                When(latest_movement_date__gte=latest, then=F('latest_movement_date')),
+                default=Value(latest)
+            )
+        earliest = earliest or cls.BEGINNING
+        backdated = Q(latest_movement_date__gt=earliest)
+        cls._bump(
+            history_revision=Case(
+                When(backdated, then=F('history_revision') + 1),
+                default=F('history_revision'),
+                output_field=models.PositiveBigIntegerField()
+            ),
+            backdated_from=Case(
+                When(backdated & Q(backdated_from__lte=earliest), then=F('backdated_from')),
+                When(backdated, then=Value(earliest)),
+                default=F('backdated_from')
+            ),
+            **changes
+        )
+
+    @classmethod
+    def record_history_change(cls):
+        """Count a change that shows in the history of every date without writing the ledger.
+
+        Product changes and rebuilds of the snapshots or the valuation.
+        """
+        cls._bump(history_revision=F('history_revision') + 1)
+
+    @classmethod
+    def record_stock_change(cls):
+        """Count a change to the current stock only, such as a corrected balance"""
+        cls._bump()
+
+
+class SlowQuery(models.Model):
+    """Slow Query - a database query that exceeded INVENTORY_SLOW_QUERY_MS, with the code that issued it"""
+    fingerprint = models.CharField(max_length=40, db_index=True, help_text="Hash of the normalized SQL")
+    normalized_sql = models.TextField(help_text="SQL with literals and parameter lists collapsed")
+    sql = models.TextField(help_text="SQL as executed")
+    params = models.TextField(blank=True, help_text="Query parameters")
+    duration_ms = models.FloatField(help_text="Execution time in milliseconds")
+    call_site = models.CharField(max_length=300, help_text="Innermost project frame that issued the query")
+    stack = models.TextField(help_text="Project frames of the Python stack, outermost first")
+    view_name = models.CharField(max_length=200, blank=True, help_text="URL name of the request")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'slowquery'
+        verbose_name = 'Slow Query'
+        verbose_name_plural = 'Slow Queries'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.duration_ms:.1f} ms - {self.call_site}"
+
+
+def record_stock_movements(deltas, transaction_date, moved_at=None, details=()):
+    """Propagate the signed quantity deltas of a ledger write, and its detail lines, to every derived table"""
+    StockBalance.apply_movements(deltas, moved_at=moved_at)
+    StockSnapshot.apply_movements(deltas, transaction_date)
+    StockBatch.apply_details(details)
+    StockValuation.apply_details(details)
+    LedgerRevision.record(transaction_date)
+
+
+def rebuild_stock_state(product_ids=None, since=None):
+    """Recompute every table derived from the ledger for the given products.
+
+    since is the earliest transaction date the change being recomputed touched,
+    if it is known.
+    """
+    drifted = StockBalance.rebuild(product_ids)
+    for period, _label in StockSnapshot.PERIODS:
+        StockSnapshot.rebuild(period, product_ids)
+    StockBatch.rebuild(product_ids)
+    StockValuation.rebuild(product_ids)
+    LedgerRevision.record(since)
+    return drifted
@@ -0,0 +1,133 @@
+import base64
+import json
+from functools import reduce
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, with opaque cursors to its neighbours"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(key, pk, reverse=False):
+    payload = json.dumps({'k': key.isoformat(), 'id': pk, 'r': reverse})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (key, pk, reverse) for a cursor string; raises ValueError when it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        key = parse_datetime(payload['k'])
+        pk = int(payload['id'])
+        reverse = bool(payload.get('r'))
+    except (TypeError, KeyError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if key is None:
+        raise ValueError('Invalid cursor')
+    return key, pk, reverse
+
+
+def paginate_keyset(queryset, key_field, cursor=None, page_size=50):
+    """Return the KeysetPage after (or before) `cursor`, newest first.
+
+    Rows are ordered by (key_field, id) descending and each page is selected
+    with a range condition on that pair, so deep pages never use OFFSET.
+    """
+    reverse = False
+    if cursor:
+        key, pk, reverse = decode_cursor(cursor)
+        if reverse:
+            after = Q(**{f'{key_field}__gt': key}) | Q(**{key_field: key, 'id__gt': pk})
+        else:
+            after = Q(**{f'{key_field}__lt': key}) | Q(**{key_field: key, 'id__lt': pk})
+        queryset = queryset.filter(after)
+
+    if reverse:
+        queryset = queryset.order_by(key_field, 'id')
+    else:
+        queryset = queryset.order_by(f'-{key_field}', '-id')
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if reverse:
+        items.reverse()
+    if not items:
+        return KeysetPage(items)
+
+    def key_of(item):
+        return reduce(getattr, key_field.split('__'), item)
+
+    has_next = has_more if not reverse else True
+    has_previous = has_more if reverse else bool(cursor)
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(key_of(items[-1]), items[-1].id) if has_next else None,
+        previous_cursor=encode_cursor(key_of(items[0]), items[0].id, reverse=True) if has_previous else None,
+    )
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination over (key_field, id) using opaque ?cursor= values"""
+    key_field = 'created_at'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+
+    def __init__(self, key_field=None):
+        if key_field:
+            self.key_field = key_field
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate_keyset(
+                queryset,
+                self.key_field,
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=self.get_page_size(request)
+            )
+        except ValueError as e:
+            raise NotFound(str(e))
+        return self.page.items
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data
+        })
+
+
+class TransactionDatePagination(KeysetPagination):
+    key_field = 'transaction_date'
@@ -0,0 +1,153 @@
+"""On-demand cProfile capture of requests.
+
+A request is profiled when it carries an X-Profile-Token header matching
+INVENTORY_PROFILE_TOKEN, or at random with probability
+INVENTORY_PROFILE_SAMPLE_RATE. Each profile is saved to INVENTORY_PROFILE_DIR
+as a .prof file with a .json file of metadata next to it, and only the latest
+INVENTORY_PROFILE_LIMIT profiles are kept. Summarize them with
+`python manage.py profile_summary`.
+
+Under ASGI the profiler runs in the event loop thread, one request at a time
+per process: it sees the async view code, while the async ORM's queries run
+in a worker thread and are only counted and timed.
+"""
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .metrics import count_queries
+
+PROFILE_HEADER = 'HTTP_X_PROFILE_TOKEN'
+
+
+def profile_dir():
+    return str(getattr(
+        settings, 'INVENTORY_PROFILE_DIR',
+        os.path.join(tempfile.gettempdir(), 'warehouse-inventory-profiles')
+    ))
+
+
+def load_profiles(directory=None):
+    """Metadata of the saved profiles, oldest first, each with the path of its .prof file"""
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as stream:
+                metadata = json.load(stream)
+        except (OSError, ValueError):
+            continue
+        metadata['path'] = os.path.join(directory, name[:-len('.json')] + '.prof')
+        if os.path.exists(metadata['path']):
+            profiles.append(metadata)
+    return profiles
+
+
+def _prune(directory, limit):
+    names = sorted(name[:-len('.prof')] for name in os.listdir(directory) if name.endswith('.prof'))
+    for name in names[:max(0, len(names) - limit)]:
+        for extension in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """Run sampled or explicitly requested requests under cProfile; removed from the chain when disabled"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.token = getattr(settings, 'INVENTORY_PROFILE_TOKEN', None)
+        self.sample_rate = getattr(settings, 'INVENTORY_PROFILE_SAMPLE_RATE', 0)
+        if not self.token and not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Only one profiler can run in the event loop thread
+        self.profiling_async = False
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request):
+        header = request.META.get(PROFILE_HEADER)
+        if self.token and header:
+            return hmac.compare_digest(header, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with count_queries() as timer:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        self._save(request, response, profiler, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        if self.profiling_async or not self.should_profile(request):
+            return await self.get_response(request)
+
+        self.profiling_async = True
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        # The async ORM runs a request's queries in one worker thread, so the
+        # connections are wrapped in that thread rather than in the event loop
+        stack = ExitStack()
+        timer = await sync_to_async(stack.enter_context)(count_queries())
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            self.profiling_async = False
+            await sync_to_async(stack.close)()
+        await sync_to_async(self._save)(request, response, profiler, time.perf_counter() - started, timer)
+        return response
+
+    def _save(self, request, response, profiler, duration, timer):
+        """Write the profile and its metadata, and tag the response with the profile ID"""
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{re.sub(r'[^A-Za-z0-9_-]+', '_', view)}"
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+        with open(os.path.join(directory, f'{profile_id}.json'), 'w', encoding='utf-8') as stream:
+            json.dump({
+                'id': profile_id,
+                'view': view,
+                'method': request.method,
+                'url': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 3),
+                'queries': timer.count,
+                'sql_ms': round(timer.seconds * 1000, 3),
+                'created_at': timezone.now().isoformat(),
+            }, stream)
+        _prune(directory, getattr(settings, 'INVENTORY_PROFILE_LIMIT', 200))
+
+        response['X-Profile-Id'] = profile_id
@@ -1,6 +1,10 @@
+from datetime import timedelta
 from rest_framework import serializers
-from .models import ProdMast, StckMain, StckDetail
+from .models import ProdMast, StckMain, StckDetail, StockReservation, record_stock_movements, stock_check_atomic
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 
 class ProdMastSerializer(serializers.ModelSerializer):
@@ -102,45 +106,126 @@ class StockMovementSerializer(serializers.Serializer):
                     raise serializers.ValidationError("Unit price must be greater than 0")
             except ValueError:
                 raise serializers.ValidationError("Unit price must be a valid number")
+            
+            if item.get('expiry_date'):
+                try:
+                    if not parse_date(item['expiry_date']):
+                        raise ValueError
+                except ValueError:
+                    raise serializers.ValidationError("Expiry date must be a valid date (YYYY-MM-DD)")
+            
+            if item.get('reservation_id'):
+                try:
+                    int(item['reservation_id'])
+                except ValueError:
+                    raise serializers.ValidationError("Reservation ID must be a valid number")
         
         return value
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
+        sign = StckMain.STOCK_SIGNS.get(validated_data['transaction_type'], 0)
         
-        # Create main transaction
-        stock_main = StckMain.objects.create(**validated_data)
-        
-        # Create detail records
+        requested = {}
+        reservation_ids = {}
         for item_data in items_data:
             try:
-                product = ProdMast.objects.get(id=item_data['product_id'])
-            except ProdMast.DoesNotExist:
+                product_id = int(item_data['product_id'])
+            except ValueError:
                 raise serializers.ValidationError(f"Product with ID {item_data['product_id']} not found")
+            if product_id in requested:
+                raise serializers.ValidationError(f"Product with ID {product_id} is listed more than once")
+            requested[product_id] = int(item_data['quantity'])
+            if item_data.get('reservation_id'):
+                reservation_ids[product_id] = int(item_data['reservation_id'])
+        if reservation_ids and validated_data['transaction_type'] != 'OUT':
+            raise serializers.ValidationError("Only stock out items can consume a reservation")
+        
+        with stock_check_atomic():
+            # One query for every referenced product together with its balance
+            products = ProdMast.objects.with_stock().in_bulk(list(requested))
+            missing = [product_id for product_id in requested if product_id not in products]
+            if missing:
+                raise serializers.ValidationError(f"Product with ID {missing[0]} not found")
             
-            # For OUT transactions, check stock availability
+            # For OUT transactions, check stock availability with the balances locked,
+            # so a concurrent stock out of the same product waits for this one to commit
             if validated_data['transaction_type'] == 'OUT':
-                current_stock = product.current_stock
-                requested_qty = int(item_data['quantity'])
-                if requested_qty > current_stock:
-                    raise serializers.ValidationError(
-                        f"Insufficient stock for {product.product_name}. "
-                        f"Available: {current_stock}, Requested: {requested_qty}"
-                    )
+                available = StockReservation.lock_available(list(requested), consuming=reservation_ids.values())
+                reservations = StockReservation.objects.select_for_update().in_bulk(list(reservation_ids.values()))
+                for product_id, reservation_id in reservation_ids.items():
+                    reservation = reservations.get(reservation_id)
+                    if reservation is None or reservation.product_id != product_id or not reservation.is_held:
+                        raise serializers.ValidationError(
+                            f"Reservation {reservation_id} is not an active hold on product {product_id}"
+                        )
+                for product_id, requested_qty in requested.items():
+                    if requested_qty > available[product_id]:
+                        raise serializers.ValidationError(
+                            f"Insufficient stock for {products[product_id].product_name}. "
+                            f"Available: {available[product_id]}, Requested: {requested_qty}"
+                        )
+            
+            # Create main transaction
+            stock_main = StckMain.objects.create(**validated_data)
             
-            StckDetail.objects.create(
-                stck_main=stock_main,
-                product=product,
-                quantity=int(item_data['quantity']),
-                unit_price=float(item_data['unit_price']),
-                batch_number=item_data.get('batch_number', ''),
-                expiry_date=item_data.get('expiry_date'),
-                remarks=item_data.get('remarks', '')
+            # Create detail records
+            details = [
+                StckDetail(
+                    stck_main=stock_main,
+                    product=products[int(item_data['product_id'])],
+                    quantity=int(item_data['quantity']),
+                    unit_price=float(item_data['unit_price']),
+                    batch_number=item_data.get('batch_number', ''),
+                    # Parsed here, since the batches compare it with stored dates
+                    expiry_date=parse_date(item_data['expiry_date']) if item_data.get('expiry_date') else None,
+                    remarks=item_data.get('remarks', '')
+                )
+                for item_data in items_data
+            ]
+            for detail in details:
+                detail.sync_from_main()
+            StckDetail.objects.bulk_create(details, batch_size=1000)
+            
+            deltas = {product_id: sign * quantity for product_id, quantity in requested.items()}
+            record_stock_movements(
+                deltas, stock_main.transaction_date, moved_at=details[-1].created_at, details=details
+            )
+            # A reservation is fulfilled by one stock out line; any remainder is released with it
+            StockReservation.objects.filter(id__in=reservation_ids.values()).update(
+                status='CONSUMED', updated_at=timezone.now()
             )
         
         return stock_main
 
 
+class StockReservationSerializer(serializers.ModelSerializer):
+    """Serializer for holds on product stock"""
+    product_code = serializers.CharField(source='product.product_code', read_only=True)
+    ttl_seconds = serializers.IntegerField(
+        write_only=True,
+        required=False,
+        min_value=1,
+        help_text="Seconds the hold lasts (default INVENTORY_RESERVATION_TTL)"
+    )
+    is_held = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = StockReservation
+        fields = [
+            'id', 'product', 'product_code', 'quantity', 'reference', 'created_by',
+            'status', 'is_held', 'expires_at', 'created_at', 'ttl_seconds'
+        ]
+        read_only_fields = ['status', 'expires_at', 'created_at']
+    
+    def create(self, validated_data):
+        ttl = validated_data.pop('ttl_seconds', None) or getattr(settings, 'INVENTORY_RESERVATION_TTL', 900)
+        try:
+            return StockReservation.reserve(expires_at=timezone.now() + timedelta(seconds=ttl), **validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+
 class InventoryReportSerializer(serializers.Serializer):
     """Serializer for inventory report"""
     product_code = serializers.CharField()
@@ -0,0 +1,177 @@
+"""Opt-in log of slow database queries and the code that issued them.
+
+Set INVENTORY_SLOW_QUERY_MS to enable it. Queries slower than that are kept
+with their parameters and the project frames of the Python stack, and written
+to the slowquery table when the request finishes. The table is trimmed to the
+latest INVENTORY_SLOW_QUERY_LIMIT rows.
+"""
+import hashlib
+import math
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+STACK_DEPTH = 8
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Replace literals and placeholders with ? and collapse IN lists, so equivalent queries match"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+def _project_frames():
+    """Frames of the current stack inside the project, excluding this module and installed packages"""
+    root = str(settings.BASE_DIR)
+    frames = []
+    for frame in traceback.extract_stack():
+        filename = frame.filename
+        if not filename.startswith(root) or 'site-packages' in filename or filename == __file__:
+            continue
+        frames.append(f'{os.path.relpath(filename, root)}:{frame.lineno} in {frame.name}')
+    return frames[-STACK_DEPTH:]
+
+
+class SlowQueryRecorder:
+    """Database execute wrapper keeping the queries slower than threshold_ms"""
+
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.entries.append((sql, params, duration, _project_frames()))
+
+
+@contextmanager
+def capture_slow_queries(threshold_ms):
+    """Record the slow queries run on any database inside the block"""
+    recorder = SlowQueryRecorder(threshold_ms)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def save(entries, view_name=''):
+    """Write recorded queries to the slowquery table and drop the oldest beyond the limit"""
+    from .models import SlowQuery
+
+    rows = []
+    for sql, params, duration, frames in entries:
+        normalized_sql = normalize(sql)
+        rows.append(SlowQuery(
+            fingerprint=fingerprint(normalized_sql),
+            normalized_sql=normalized_sql,
+            sql=sql,
+            params=repr(params)[:2000],
+            duration_ms=round(duration * 1000, 3),
+            call_site=(frames[-1] if frames else '(outside project code)')[:300],
+            stack='\n'.join(frames),
+            view_name=view_name[:200],
+        ))
+    SlowQuery.objects.bulk_create(rows)
+
+    limit = getattr(settings, 'INVENTORY_SLOW_QUERY_LIMIT', 10000)
+    cutoff = SlowQuery.objects.order_by('-id').values_list('id', flat=True)[limit:limit + 1].first()
+    if cutoff is not None:
+        SlowQuery.objects.filter(id__lte=cutoff).delete()
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an ascending list"""
+    rank = max(1, math.ceil(len(sorted_values) * percent / 100))
+    return sorted_values[rank - 1]
+
+
+def summarize(queryset, top_call_sites=3):
+    """Group slow queries by fingerprint with count, p50/p95/max time and the most frequent call sites.
+
+    Groups are ordered by total time spent, largest first.
+    """
+    groups = {}
+    for normalized_sql, fingerprint_, duration_ms, call_site in queryset.values_list(
+        'normalized_sql', 'fingerprint', 'duration_ms', 'call_site'
+    ).iterator(chunk_size=2000):
+        group = groups.setdefault(fingerprint_, {'normalized_sql': normalized_sql, 'durations': [], 'call_sites': {}})
+        group['durations'].append(duration_ms)
+        group['call_sites'][call_site] = group['call_sites'].get(call_site, 0) + 1
+
+    summary = []
+    for fingerprint_, group in groups.items():
+        durations = sorted(group['durations'])
+        summary.append({
+            'fingerprint': fingerprint_,
+            'normalized_sql': group['normalized_sql'],
+            'count': len(durations),
+            'p50_ms': _percentile(durations, 50),
+            'p95_ms': _percentile(durations, 95),
+            'max_ms': durations[-1],
+            'total_ms': round(sum(durations), 3),
+            'call_sites': sorted(group['call_sites'].items(), key=lambda item: -item[1])[:top_call_sites],
+        })
+    summary.sort(key=lambda group: -group['total_ms'])
+    return summary
+
+
+class SlowQueryMiddleware:
+    """Log the slow queries of each request; removed from the chain unless INVENTORY_SLOW_QUERY_MS is set"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.threshold_ms = getattr(settings, 'INVENTORY_SLOW_QUERY_MS', None)
+        if self.threshold_ms is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with capture_slow_queries(self.threshold_ms) as recorder:
+            response = self.get_response(request)
+        if recorder.entries:
+            match = request.resolver_match
+            save(recorder.entries, match.view_name if match else '')
+        return response
+
+    async def __acall__(self, request):
+        # Wrap the connections of the worker thread that runs the request's async ORM queries
+        stack = ExitStack()
+        recorder = await sync_to_async(stack.enter_context)(capture_slow_queries(self.threshold_ms))
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        if recorder.entries:
+            match = request.resolver_match
+            await sync_to_async(save)(recorder.entries, match.view_name if match else '')
+        return response
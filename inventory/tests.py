@@ -1,3 +1,907 @@
-from django.test import TestCase
+import json
+import os
+import statistics
+import tempfile
+import time
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as dtime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, reset_queries
+from django.db.models import Sum
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import caching
+from .models import (
+    CostLayer, ProdMast, StckMain, StckDetail, StockBalance, StockBatch, StockReservation, StockSnapshot,
+    StockValuation, ValuationEntry
+)
+from .views import parse_query_datetime
+
+
+class StockMovementMixin:
+    """Posts one-line stock movements through the API for tests that set self.client and self.product"""
+
+    def move(self, transaction_id, transaction_type, quantity, days_ago=None, product=None, **item):
+        """Post a movement and return its StckMain; item overrides unit_price or sets batch_number/expiry_date"""
+        line = {'product_id': str((product or self.product).id), 'quantity': str(quantity), 'unit_price': '10.00'}
+        line.update({field: value.isoformat() if isinstance(value, date) else value for field, value in item.items()})
+        movement = {
+            'transaction_id': transaction_id,
+            'transaction_type': transaction_type,
+            'created_by': 'tester',
+            'items': [line]
+        }
+        if days_ago is not None:
+            movement['transaction_date'] = (timezone.now() - timedelta(days=days_ago)).isoformat()
+        response = self.client.post('/api/stock-movement/', movement, format='json')
+        self.assertEqual(response.status_code, 201)
+        return StckMain.objects.get(transaction_id=transaction_id)
+
+
+class StckMainListQueryCountTest(TestCase):
+    """Listing transactions must cost a constant number of queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.products = [
+            ProdMast.objects.create(
+                product_code=f'PRD{i:03d}', product_name=f'Product {i}', unit='pcs', price='10.00'
+            )
+            for i in range(3)
+        ]
+
+    def create_transactions(self, count):
+        for _ in range(count):
+            response = self.client.post('/api/stock-movement/', {
+                'transaction_id': f'SI-{StckMain.objects.count() + 1:04d}',
+                'transaction_type': 'IN',
+                'created_by': 'tester',
+                'items': [
+                    {'product_id': str(product.id), 'quantity': '5', 'unit_price': '10.00'}
+                    for product in self.products
+                ]
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/transactions/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['results']
+
+    def test_query_count_does_not_grow_with_transactions(self):
+        self.create_transactions(2)
+        few_queries, _ = self.count_list_queries()
+
+        self.create_transactions(10)
+        many_queries, results = self.count_list_queries()
+
+        self.assertEqual(len(results), 12)
+        self.assertEqual(few_queries, many_queries)
+
+    def test_totals_and_product_fields_are_serialized(self):
+        self.create_transactions(1)
+        _, results = self.count_list_queries()
+
+        self.assertEqual(results[0]['total_items'], 3)
+        self.assertEqual(results[0]['total_quantity'], 15)
+        self.assertEqual(
+            sorted(detail['product_code'] for detail in results[0]['details']),
+            ['PRD000', 'PRD001', 'PRD002']
+        )
+
+
+class StockOutConcurrencyTest(TransactionTestCase):
+    """Stock outs and reservations of one product, sent from many threads at once, must never oversell it"""
+    THREADS = 8
+    ATTEMPTS = 15
+    STOCK = 40
+
+    def setUp(self):
+        self.product = ProdMast.objects.create(product_code='HOT', product_name='Hot item', unit='pcs', price='10.00')
+        self.other = ProdMast.objects.create(product_code='COLD', product_name='Cold item', unit='pcs', price='10.00')
+        response = APIClient().post('/api/stock-movement/', {
+            'transaction_id': 'SEED',
+            'transaction_type': 'IN',
+            'created_by': 'tester',
+            'items': [
+                {'product_id': str(product.id), 'quantity': str(self.STOCK), 'unit_price': '10.00'}
+                for product in (self.product, self.other)
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.start = threading.Barrier(self.THREADS)
+
+    def hammer(self, worker):
+        """Alternate single-unit stock outs and reservations; returns the status codes of each"""
+        client = APIClient()
+        outs = []
+        reservations = []
+        try:
+            self.start.wait()
+            for attempt in range(self.ATTEMPTS):
+                if attempt % 3 == 2:
+                    response = client.post('/api/reservations/', {
+                        'product': self.product.id, 'quantity': 1, 'created_by': f'worker-{worker}'
+                    }, format='json')
+                    reservations.append(response.status_code)
+                else:
+                    response = client.post('/api/stock-movement/', {
+                        'transaction_id': f'OUT-{worker}-{attempt}',
+                        'transaction_type': 'OUT',
+                        'created_by': f'worker-{worker}',
+                        'items': [{'product_id': str(self.product.id), 'quantity': '1', 'unit_price': '10.00'}]
+                    }, format='json')
+                    outs.append(response.status_code)
+        finally:
+            connection.close()
+        return outs, reservations
+
+    # SQLite ignores SELECT ... FOR UPDATE, so there this would only exercise its database-wide write lock
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_one_product_is_never_oversold(self):
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            results = list(pool.map(self.hammer, range(self.THREADS)))
+
+        shipped = sum(outs.count(201) for outs, _ in results)
+        held = sum(reservations.count(201) for _, reservations in results)
+        self.assertGreater(self.THREADS * self.ATTEMPTS, self.STOCK)
+        # Every unit was allocated exactly once and the rest of the requests were refused
+        self.assertEqual(shipped + held, self.STOCK)
+
+        balance = StockBalance.objects.get(product=self.product).quantity
+        ledger = StckDetail.objects.filter(product=self.product).aggregate(total=Sum('signed_quantity'))['total']
+        self.assertEqual(balance, ledger)
+        self.assertEqual(balance, self.STOCK - shipped)
+        self.assertEqual(StockReservation.held([self.product.id]).get(self.product.id, 0), held)
+        self.assertEqual(StockBalance.objects.get(product=self.other).quantity, self.STOCK)
+
+    def test_consuming_a_reservation_ships_the_held_stock(self):
+        client = APIClient()
+        reservation = client.post('/api/reservations/', {
+            'product': self.product.id, 'quantity': self.STOCK, 'created_by': 'tester'
+        }, format='json').json()
+
+        def stock_out(transaction_id, **item):
+            return client.post('/api/stock-movement/', {
+                'transaction_id': transaction_id,
+                'transaction_type': 'OUT',
+                'created_by': 'tester',
+                'items': [{'product_id': str(self.product.id), 'quantity': '1', 'unit_price': '10.00', **item}]
+            }, format='json')
+
+        self.assertEqual(stock_out('UNRESERVED').status_code, 400)
+        self.assertEqual(stock_out('RESERVED', reservation_id=str(reservation['id'])).status_code, 201)
+        self.assertEqual(StockReservation.objects.get(id=reservation['id']).status, 'CONSUMED')
+        self.assertEqual(stock_out('REUSED', reservation_id=str(reservation['id'])).status_code, 400)
+        self.assertEqual(stock_out('FREED').status_code, 201)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_only_stock_writes_take_the_sqlite_write_lock_up_front(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/products/')
+        self.assertNotIn('BEGIN IMMEDIATE', [query['sql'] for query in queries])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/stock-movement/', {
+                'transaction_id': 'LOCKED',
+                'transaction_type': 'OUT',
+                'created_by': 'tester',
+                'items': [{'product_id': str(self.product.id), 'quantity': '1', 'unit_price': '10.00'}]
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('BEGIN IMMEDIATE', [query['sql'] for query in queries])
+        self.assertIsNone(connection.transaction_mode)
+
+
+class TransactionEditTest(StockMovementMixin, TestCase):
+    """Editing or deleting a transaction through the API must keep the derived stock in line with the ledger"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='EDIT', product_name='Edited', unit='pcs', price='10.00')
+        self.stock_in = self.move('IN-1', 'IN', 10)
+        self.stock_out = self.move('OUT-1', 'OUT', 3)
+
+    def assertBalanceMatchesLedger(self, expected):
+        ledger = StckDetail.objects.filter(product=self.product).aggregate(total=Sum('signed_quantity'))['total']
+        self.assertEqual(ledger, expected)
+        self.assertEqual(StockBalance.objects.get(product=self.product).quantity, expected)
+
+    def test_delete_rebuilds_balance(self):
+        response = self.client.delete(f'/api/transactions/{self.stock_out.id}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertBalanceMatchesLedger(10)
+
+    def test_type_change_resigns_lines_and_rebuilds_balance(self):
+        response = self.client.patch(f'/api/transactions/{self.stock_out.id}/', {'transaction_type': 'IN'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock_out.details.get().signed_quantity, 3)
+        self.assertBalanceMatchesLedger(13)
+
+    def test_header_save_copies_type_and_date_to_lines(self):
+        self.stock_out.transaction_type = 'IN'
+        self.stock_out.transaction_date = timezone.now() - timedelta(days=2)
+        self.stock_out.save()
+
+        detail = self.stock_out.details.get()
+        self.assertEqual(detail.signed_quantity, 3)
+        self.assertEqual(detail.transaction_date, self.stock_out.transaction_date)
+
+
+class SnapshotTest(StockMovementMixin, TestCase):
+    """A back-dated movement must correct every later snapshot, and historical stock must match the ledger"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='SNAP', product_name='Snapshot', unit='pcs', price='10.00')
+        for transaction_id, transaction_type, quantity, days_ago in [
+            ('S1', 'IN', 20, 50), ('S2', 'OUT', 6, 40), ('S3', 'IN', 10, 20), ('S4', 'OUT', 4, 5),
+        ]:
+            self.move(transaction_id, transaction_type, quantity, days_ago)
+        for period, _label in StockSnapshot.PERIODS:
+            StockSnapshot.build(period)
+
+    def ledger_stock(self, **date_filter):
+        movements = StckDetail.objects.filter(product=self.product, **date_filter)
+        return movements.aggregate(total=Sum('signed_quantity'))['total'] or 0
+
+    def test_backdated_movement_corrects_every_later_snapshot(self):
+        self.move('LATE', 'IN', 7, 45)
+
+        snapshots = StockSnapshot.objects.filter(product=self.product)
+        self.assertTrue(snapshots.filter(period='day').exists())
+        self.assertTrue(snapshots.filter(period='month').exists())
+        for snapshot in snapshots:
+            self.assertEqual(snapshot.quantity, self.ledger_stock(transaction_date__lt=snapshot.period_end), snapshot)
+
+    def test_backdated_movement_in_a_period_without_a_snapshot(self):
+        other = ProdMast.objects.create(product_code='OTHER', product_name='Other', unit='pcs', price='10.00')
+        self.move('OTHER-IN', 'IN', 2, 1, product=other)
+        for period, _label in StockSnapshot.PERIODS:
+            StockSnapshot.build(period)
+
+        # Snapshots are built up to today, but this product did not move three days ago
+        self.move('LATE', 'IN', 7, 3)
+        self.move('TODAY', 'IN', 1, 0)
+        for period, _label in StockSnapshot.PERIODS:
+            StockSnapshot.build(period, until=timezone.now() + timedelta(days=40))
+
+        for snapshot in StockSnapshot.objects.filter(product=self.product):
+            self.assertEqual(snapshot.quantity, self.ledger_stock(transaction_date__lt=snapshot.period_end), snapshot)
+        tomorrow = timezone.now() + timedelta(days=1)
+        self.assertEqual(self.product.stock_at_date(tomorrow), StockBalance.objects.get(product=self.product).quantity)
+        self.assertEqual(ProdMast.objects.with_stock_at(tomorrow).get(pk=self.product.pk).historical_stock, 28)
+
+    def test_stock_at_date_matches_ledger(self):
+        self.move('LATE', 'OUT', 3, 30)
+
+        for days_ago in range(0, 60, 3):
+            target_date = timezone.now() - timedelta(days=days_ago, hours=5)
+            expected = self.ledger_stock(transaction_date__lte=target_date)
+            self.assertEqual(self.product.stock_at_date(target_date), expected, days_ago)
+            self.assertEqual(ProdMast.objects.with_stock_at(target_date).get(pk=self.product.pk).historical_stock, expected)
+
+
+class StockBatchTest(StockMovementMixin, TestCase):
+    """Stock outs deplete batches earliest expiry first, and /api/expiring-stock/ lists what is left"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='LOT', product_name='Perishable', unit='pcs', price='10.00')
+        self.today = timezone.localdate()
+        self.move('IN-1', 'IN', 5, batch_number='UNDATED')
+        self.move('IN-2', 'IN', 5, batch_number='LATER', expiry_date=self.today + timedelta(days=60))
+        self.move('IN-3', 'IN', 5, batch_number='SOON', expiry_date=self.today + timedelta(days=10))
+        self.move('IN-4', 'IN', 5, batch_number='EXPIRED', expiry_date=self.today - timedelta(days=3))
+
+    def remaining(self):
+        return dict(StockBatch.objects.filter(product=self.product).values_list('batch_number', 'quantity'))
+
+    def test_stock_out_depletes_earliest_expiry_first(self):
+        self.move('OUT-1', 'OUT', 7)
+        self.assertEqual(self.remaining(), {'EXPIRED': 5, 'SOON': 0, 'LATER': 3, 'UNDATED': 5})
+
+        self.move('OUT-2', 'OUT', 7)
+        self.assertEqual(self.remaining(), {'EXPIRED': 5, 'SOON': 0, 'LATER': 0, 'UNDATED': 1})
+
+    def test_expired_batch_is_only_taken_by_name_or_before_it_expired(self):
+        self.move('IN-5', 'IN', 3, days_ago=10, batch_number='OLD', expiry_date=self.today - timedelta(days=4))
+        self.move('OUT-1', 'OUT', 2, days_ago=5)
+        self.move('OUT-2', 'OUT', 1)
+        self.move('WRITE-OFF', 'OUT', 5, batch_number='EXPIRED')
+
+        expected = {'OLD': 1, 'EXPIRED': 0, 'SOON': 4, 'LATER': 5, 'UNDATED': 5}
+        self.assertEqual(self.remaining(), expected)
+        StockBatch.rebuild([self.product.id])
+        self.assertEqual(self.remaining(), expected)
+
+    def test_stock_out_of_a_named_batch_takes_it_first(self):
+        self.move('OUT-1', 'OUT', 7, batch_number='LATER')
+
+        self.assertEqual(self.remaining(), {'EXPIRED': 5, 'SOON': 3, 'LATER': 0, 'UNDATED': 5})
+        StockBatch.rebuild([self.product.id])
+        self.assertEqual(self.remaining(), {'EXPIRED': 5, 'SOON': 3, 'LATER': 0, 'UNDATED': 5})
+
+    def test_expiring_stock_leaves_out_expired_batches_unless_asked(self):
+        response = self.client.get('/api/expiring-stock/', {'days': 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(batch['batch_number'], batch['days_left']) for batch in response.json()['batches']], [('SOON', 10)])
+
+        response = self.client.get('/api/expiring-stock/', {'days': 90, 'include_expired': 'true'})
+        self.assertEqual(
+            [(batch['batch_number'], batch['days_left']) for batch in response.json()['batches']],
+            [('EXPIRED', -3), ('SOON', 10), ('LATER', 60)]
+        )
+
+    def test_expiring_stock_leaves_out_depleted_batches(self):
+        self.move('OUT-1', 'OUT', 5, batch_number='SOON')
+
+        response = self.client.get('/api/expiring-stock/', {'days': 30})
+
+        self.assertEqual(response.json()['batches'], [])
+        self.assertEqual(self.client.get('/api/expiring-stock/', {'days': -1}).status_code, 400)
+
+
+class StockValuationTest(StockMovementMixin, TestCase):
+    """Average and FIFO values must follow the ledger in date order, however the lines arrive"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='VAL', product_name='Valued', unit='pcs', price='10.00')
+
+    def assertValued(self):
+        # IN 5@2, IN 10@1, IN 10@3 average 2.00; OUT 15 issues 5@2 and 10@1 first in first out
+        valuation = StockValuation.objects.get(product=self.product)
+        self.assertEqual(valuation.quantity, 10)
+        self.assertEqual(valuation.average_value, Decimal('20'))
+        self.assertEqual(valuation.fifo_value, Decimal('30'))
+        self.assertEqual(
+            list(CostLayer.objects.filter(product=self.product, remaining__gt=0).values_list('remaining', 'unit_cost')),
+            [(10, Decimal('3.00'))]
+        )
+
+    def test_values_in_date_order(self):
+        self.move('IN-1', 'IN', 5, days_ago=4, unit_price='2.00')
+        self.move('IN-2', 'IN', 10, days_ago=3, unit_price='1.00')
+        self.move('IN-3', 'IN', 10, days_ago=2, unit_price='3.00')
+        self.move('OUT-1', 'OUT', 15, days_ago=1, unit_price='2.00')
+
+        self.assertValued()
+
+    def test_backdated_receipt_replays_later_lines(self):
+        self.move('IN-2', 'IN', 10, days_ago=3, unit_price='1.00')
+        self.move('IN-3', 'IN', 10, days_ago=2, unit_price='3.00')
+        self.move('OUT-1', 'OUT', 15, days_ago=1, unit_price='2.00')
+
+        self.move('IN-1', 'IN', 5, days_ago=4, unit_price='2.00')
+
+        self.assertValued()
+        StockValuation.rebuild([self.product.id])
+        self.assertValued()
+        response = self.client.get('/api/valuation/')
+        self.assertEqual(response.json()['total_average_value'], '20.00')
+        self.assertEqual(response.json()['total_fifo_value'], '30.00')
+
+
+class StockStatusTest(StockMovementMixin, TestCase):
+    """The stored stock status follows movements, minimum_stock changes and rebuilds"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(
+            product_code='STAT', product_name='Status', unit='pcs', price='10.00', minimum_stock=5
+        )
+        self.stocked = ProdMast.objects.create(
+            product_code='FULL', product_name='Stocked', unit='pcs', price='10.00', minimum_stock=5
+        )
+        self.move('FULL-IN', 'IN', 50, product=self.stocked)
+
+    def status(self):
+        return StockBalance.objects.get(product=self.product).status
+
+    def alert_codes(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], len(response.json()['products']))
+        return [product['product_code'] for product in response.json()['products']]
+
+    def test_status_follows_movements(self):
+        self.assertEqual(self.status(), StockBalance.OUT_OF_STOCK)
+        self.move('IN-1', 'IN', 4)
+        self.assertEqual(self.status(), StockBalance.LOW_STOCK)
+        self.move('IN-2', 'IN', 6)
+        self.assertEqual(self.status(), StockBalance.IN_STOCK)
+        self.move('OUT-1', 'OUT', 10)
+        self.assertEqual(self.status(), StockBalance.OUT_OF_STOCK)
+
+    def test_status_follows_minimum_stock(self):
+        self.move('IN-1', 'IN', 8)
+        self.assertEqual(self.status(), StockBalance.IN_STOCK)
+
+        self.product.minimum_stock = 10
+        self.product.save()
+
+        self.assertEqual(self.status(), StockBalance.LOW_STOCK)
+
+    def test_rebuild_restores_status(self):
+        self.move('IN-1', 'IN', 3)
+        StockBalance.objects.filter(product=self.product).update(status=StockBalance.IN_STOCK)
+
+        self.assertEqual(StockBalance.rebuild([self.product.id]), 1)
+        self.assertEqual(self.status(), StockBalance.LOW_STOCK)
+
+    def test_alert_endpoints(self):
+        self.assertEqual(self.alert_codes('/api/out-of-stock/'), ['STAT'])
+        self.assertEqual(self.alert_codes('/api/low-stock/'), [])
+
+        self.move('IN-1', 'IN', 2)
+        self.assertEqual(self.alert_codes('/api/out-of-stock/'), [])
+        self.assertEqual(self.alert_codes('/api/low-stock/'), ['STAT'])
+
+        self.product.is_active = False
+        self.product.save()
+        self.assertEqual(self.alert_codes('/api/low-stock/'), [])
+
+
+class DateOnlyQueryTest(TestCase):
+    """A date without a time must cover the whole day, including movements later that day"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='DAY', product_name='Day', unit='pcs', price='10.00')
+        self.day = timezone.localdate() - timedelta(days=3)
+        moved_at = timezone.make_aware(timezone.datetime.combine(self.day, dtime(15, 30)))
+        response = self.client.post('/api/stock-movement/', {
+            'transaction_id': 'AFTERNOON',
+            'transaction_type': 'IN',
+            'transaction_date': moved_at.isoformat(),
+            'created_by': 'tester',
+            'items': [{'product_id': str(self.product.id), 'quantity': '7', 'unit_price': '10.00'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_parse_query_datetime_uses_default_time_for_dates(self):
+        parsed = parse_query_datetime(self.day.isoformat(), dtime(23, 59, 59))
+
+        self.assertEqual(timezone.localtime(parsed).time(), dtime(23, 59, 59))
+        self.assertEqual(timezone.localtime(parse_query_datetime(f'{self.day} 08:00:00')).time(), dtime(8, 0))
+
+    def test_historical_inventory_includes_same_day_movement(self):
+        response = self.client.get('/api/historical-inventory/', {'date': self.day.isoformat()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inventory_snapshot'][0]['stock_at_date'], 7)
+
+    def test_valuation_includes_same_day_movement(self):
+        response = self.client.get('/api/valuation/', {'date': self.day.isoformat()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][0]['quantity'], 7)
+        self.assertEqual(response.json()['total_fifo_value'], '70.00')
+
+
+class ConditionalGetTest(StockMovementMixin, TestCase):
+    """ETags come from the ledger revision row, and only settled history is served with a long max-age"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = ProdMast.objects.create(product_code='ETAG', product_name='Tagged', unit='pcs', price='10.00')
+        self.move('OLD', 'IN', 10, days_ago=10)
+        self.move('RECENT', 'IN', 5, days_ago=2)
+        self.date = (timezone.localdate() - timedelta(days=5)).isoformat()
+
+    def get_historical(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/historical-inventory/', {'date': self.date}, **headers)
+
+    def test_unchanged_ledger_answers_304_without_reading_the_ledger(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'stckdetail' in query['sql']])
+        self.move('NEW', 'IN', 1, days_ago=0)
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_settled_history_ignores_later_movements(self):
+        response = self.get_historical()
+        self.assertIn('max-age=86400', response['Cache-Control'])
+
+        self.move('NEW', 'IN', 1, days_ago=0)
+
+        self.assertEqual(self.get_historical(response['ETag']).status_code, 304)
+
+    def test_backdated_movement_changes_etag_and_stops_long_caching(self):
+        etag = self.get_historical()['ETag']
+
+        self.move('LATE', 'IN', 3, days_ago=7)
+        response = self.get_historical(etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inventory_snapshot'][0]['stock_at_date'], 13)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_backdated_movement_after_the_date_keeps_it_settled(self):
+        etag = self.get_historical()['ETag']
+
+        self.move('LATE', 'IN', 3, days_ago=3)
+        response = self.get_historical()
+
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('max-age=86400', response['Cache-Control'])
+
+    def test_rebuilds_change_the_etags(self):
+        report_etag = self.client.get('/api/inventory-report/')['ETag']
+        valuation_etag = self.client.get('/api/valuation/', {'date': self.date})['ETag']
+        StockBalance.objects.filter(product=self.product).update(quantity=99)
+
+        call_command('rebuild_stock_balances', stdout=StringIO())
+        call_command('rebuild_valuation', stdout=StringIO())
+
+        self.assertEqual(
+            self.client.get('/api/inventory-report/', HTTP_IF_NONE_MATCH=report_etag).status_code, 200
+        )
+        response = self.client.get('/api/valuation/', {'date': self.date}, HTTP_IF_NONE_MATCH=valuation_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_product_delete_changes_the_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        ProdMast.objects.filter(pk=self.product.pk).delete()
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+
+class ImportMovementsTest(TestCase):
+    """import_movements must read CSV records rather than lines and resume without duplicating a chunk"""
+
+    HEADER = 'transaction_id,transaction_type,transaction_date,product_code,quantity,unit_price,remarks\n'
+
+    def setUp(self):
+        ProdMast.objects.create(product_code='IMP', product_name='Imported', unit='pcs', price='10.00')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'movements.csv')
+
+    def write(self, rows):
+        with open(self.path, 'w', newline='', encoding='utf-8') as export:
+            export.write(self.HEADER + ''.join(rows))
+
+    def run_import(self, **options):
+        call_command('import_movements', self.path, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_quoted_field_spanning_lines(self):
+        self.write([
+            'T1,IN,2026-01-05,IMP,10,5.00,"first line\nsecond line"\n',
+            'T2,OUT,2026-01-06,IMP,4,5.00,\n',
+        ])
+
+        self.run_import()
+
+        self.assertEqual(StckDetail.objects.get(stck_main__transaction_id='T1').remarks, 'first line\nsecond line')
+        self.assertEqual(StockBalance.objects.get(product__product_code='IMP').quantity, 6)
+
+    def test_resume_skips_chunk_committed_after_the_checkpoint(self):
+        self.write(['T1,IN,2026-01-05,IMP,10,5.00,\n', 'T2,IN,2026-01-06,IMP,5,5.00,\n'])
+        self.run_import()
+        self.write([
+            'T1,IN,2026-01-05,IMP,10,5.00,\n',
+            'T2,IN,2026-01-06,IMP,5,5.00,\n',
+            'T3,OUT,2026-01-07,IMP,3,5.00,\n',
+        ])
+        # The earlier run committed T2 but stopped before recording it in the checkpoint
+        with open(f'{self.path}.checkpoint', 'w', encoding='utf-8') as checkpoint:
+            json.dump({'records_done': 1}, checkpoint)
+
+        self.run_import(chunk_size=1)
+
+        self.assertEqual(StckMain.objects.filter(transaction_id='T2').count(), 1)
+        self.assertTrue(StckMain.objects.filter(transaction_id='T3').exists())
+        self.assertEqual(StockBalance.objects.get(product__product_code='IMP').quantity, 12)
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+
+class GenerateWarehouseTest(TestCase):
+    """The derived tables the generator writes as it goes must match a replay of the generated ledger"""
+
+    def derived_rows(self):
+        return {
+            'balances': sorted(StockBalance.objects.values_list('product_id', 'quantity', 'status')),
+            'batches': sorted(StockBatch.objects.values_list('product_id', 'batch_number', 'expiry_date', 'quantity')),
+            'valuations': sorted(StockValuation.objects.values_list(
+                'product_id', 'quantity', 'average_cost', 'average_value', 'fifo_value', 'valued_through'
+            )),
+            'layers': sorted(CostLayer.objects.values_list(*CostLayer.INSERT_FIELDS)),
+            'entries': sorted(ValuationEntry.objects.values_list(*ValuationEntry.INSERT_FIELDS)),
+            'snapshots': sorted(StockSnapshot.objects.values_list('product_id', 'period', 'period_end', 'quantity')),
+        }
+
+    def test_derived_tables_match_a_rebuild(self):
+        call_command(
+            'generate_warehouse', products=20, transactions=300, days=40, prefix='GEN', stdout=StringIO()
+        )
+        generated = self.derived_rows()
+
+        StockSnapshot.objects.all().delete()
+        StockSnapshot.build(settings.INVENTORY_SNAPSHOT_PERIOD)
+        StockBatch.rebuild()
+        StockValuation.rebuild()
+
+        self.assertTrue(generated['snapshots'])
+        self.assertEqual(self.derived_rows(), generated)
+
+
+class AsyncEndpointTest(TestCase):
+    """Async endpoints read stock through annotations, and the profiling middleware stays async"""
+
+    def setUp(self):
+        self.product = ProdMast.objects.create(product_code='ASYNC', product_name='Async', unit='pcs', price='10.00')
+        response = APIClient().post('/api/stock-movement/', {
+            'transaction_id': 'ASYNC-IN',
+            'transaction_type': 'IN',
+            'transaction_date': (timezone.now() - timedelta(days=2)).isoformat(),
+            'created_by': 'tester',
+            'items': [{'product_id': str(self.product.id), 'quantity': '9', 'unit_price': '10.00'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_product_stock_reads_current_and_historical_stock_in_one_query(self):
+        url = f'/api/async/products/{self.product.id}/stock/'
+        date = (timezone.localdate() - timedelta(days=5)).isoformat()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(AsyncClient().get)(url, {'date': date})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['current_stock'], response.json()['stock_at_date']), (9, 0))
+        self.assertEqual(len(queries), 1)
+
+    async def test_profiling_middleware_profiles_async_requests(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(INVENTORY_PROFILE_TOKEN='secret', INVENTORY_PROFILE_DIR=directory.name):
+            response = await AsyncClient().get(
+                f'/api/async/products/{self.product.id}/stock/', headers={'X-Profile-Token': 'secret'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        with open(os.path.join(directory.name, f"{response['X-Profile-Id']}.json"), encoding='utf-8') as stream:
+            metadata = json.load(stream)
+        self.assertEqual(metadata['view'], 'inventory:product_stock_async_api')
+        self.assertEqual(metadata['queries'], 1)
+
+
+@override_settings(INVENTORY_CACHE_WARM_IN_BACKGROUND=False)
+class CacheInvalidationTest(TestCase):
+    """All the writes of one transaction must warm the caches once, under the new ledger revision"""
+
+    def test_bulk_ingest_invalidates_once_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            products = [
+                ProdMast.objects.create(product_code=f'C{i:02d}', product_name=f'Cached {i}', unit='pcs', price='10.00')
+                for i in range(5)
+            ]
+        body = '\n'.join(json.dumps({
+            'transaction_id': f'BULK-{i:03d}',
+            'transaction_type': 'IN',
+            'created_by': 'tester',
+            'items': [{'product_id': str(products[i % 5].id), 'quantity': '2', 'unit_price': '10.00'}]
+        }) for i in range(20))
+        version = caching.get_ledger_version()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = APIClient().post(
+                '/api/stock-movement/bulk/?batch_size=5', data=body.encode(), content_type='application/x-ndjson'
+            )
+            summary = json.loads(b''.join(response.streaming_content).splitlines()[-1])['summary']
+
+        self.assertEqual(summary['created'], 20)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(caching.get_ledger_version(), version)
+        self.assertEqual(
+            [row['stock_level'] for row in caching.product_rows()[-5:]],
+            [8, 8, 8, 8, 8]
+        )
+
+    def test_rows_follow_writes_warmed_in_another_process(self):
+        product = ProdMast.objects.create(product_code='SHARED', product_name='Shared', unit='pcs', price='10.00')
+        self.assertEqual(caching.product_rows()[-1]['stock_level'], 0)
+
+        # The on_commit warm-up never runs here, as for a write made by another worker
+        response = APIClient().post('/api/stock-movement/', {
+            'transaction_id': 'ELSEWHERE',
+            'transaction_type': 'IN',
+            'created_by': 'tester',
+            'items': [{'product_id': str(product.id), 'quantity': '4', 'unit_price': '10.00'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(caching.product_rows()[-1]['stock_level'], 4)
+
+
+@tag('benchmark')
+class EndpointBenchmarkTest(TestCase):
+    """Drive the main views over growing datasets, recording wall time, queries and peak memory.
+
+    Fails when a view's query count changes between dataset sizes, or when its
+    median time exceeds the stored baseline by more than the tolerance. The
+    report is written as JSON and markdown to INVENTORY_BENCHMARK_REPORT_DIR
+    (default: benchmark-report/). Set INVENTORY_BENCHMARK_UPDATE=1 to rewrite
+    the baseline, and exclude the suite with --exclude-tag=benchmark.
+    """
+    # (label, products, transactions) added on top of the previous size
+    SIZES = [('small', 40, 200), ('medium', 120, 600), ('large', 240, 1200)]
+    ROUNDS = 3
+    BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.end_date = timezone.localdate()
+        self.posted = 0
+
+    def seed(self, label, products, transactions):
+        call_command(
+            'generate_warehouse',
+            products=products,
+            transactions=transactions,
+            lines_per_transaction=4,
+            days=90,
+            seed=len(label),
+            end_date=self.end_date.isoformat(),
+            prefix=f'BM{label[0].upper()}',
+            stdout=StringIO(),
+        )
+
+    def endpoints(self):
+        midpoint = (self.end_date - timedelta(days=45)).isoformat()
+        transaction = StckMain.objects.order_by('id').first()
+        return [
+            ('dashboard', 'get', '/'),
+            ('product_list', 'get', '/products/'),
+            ('inventory_report', 'get', '/api/inventory-report/'),
+            ('historical_inventory', 'get', f'/api/historical-inventory/?date={midpoint}'),
+            ('stock_movement', 'post', '/api/stock-movement/'),
+            ('transaction_list', 'get', '/api/transactions/'),
+            ('transaction_detail', 'get', f'/api/transactions/{transaction.id}/'),
+        ]
+
+    def request(self, method, url):
+        if method == 'post':
+            self.posted += 1
+            products = ProdMast.objects.order_by('id')[:3]
+            return self.client.post(url, {
+                'transaction_id': f'BENCH-{self.posted:05d}',
+                'transaction_type': 'IN',
+                'created_by': 'benchmark',
+                'items': [
+                    {'product_id': str(product.id), 'quantity': '5', 'unit_price': '10.00'}
+                    for product in products
+                ]
+            }, format='json')
+        return self.client.get(url)
+
+    def measure(self, method, url):
+        """Median wall time and query count of cold-cache requests, then peak memory of one more"""
+        timings = []
+        for _ in range(self.ROUNDS):
+            cache.clear()
+            # The query log is capped, and seeding the dataset fills it
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.request(method, url)
+                timings.append(time.perf_counter() - started)
+            self.assertLess(response.status_code, 300, url)
+            query_count = len(queries)
+
+        cache.clear()
+        tracemalloc.start()
+        try:
+            self.request(method, url)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'wall_ms': round(statistics.median(timings) * 1000, 2),
+            'queries': query_count,
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def test_endpoint_budgets(self):
+        results = []
+        for label, products, transactions in self.SIZES:
+            self.seed(label, products, transactions)
+            dataset = {
+                'products': ProdMast.objects.count(),
+                'transactions': StckMain.objects.count(),
+            }
+            for view, method, url in self.endpoints():
+                results.append({'view': view, 'size': label, **dataset, **self.measure(method, url)})
+
+        failures = self.check_query_growth(results) + self.check_baseline(results)
+        self.write_report(results, failures)
+        self.assertFalse(failures, '\n'.join(failures))
+
+    def check_query_growth(self, results):
+        failures = []
+        by_view = {}
+        for result in results:
+            by_view.setdefault(result['view'], []).append(result)
+        for view, rows in by_view.items():
+            counts = [row['queries'] for row in rows]
+            if len(set(counts)) > 1:
+                sizes = ', '.join(f"{row['size']}={row['queries']}" for row in rows)
+                failures.append(f'{view}: query count grows with the dataset ({sizes})')
+        return failures
+
+    def check_baseline(self, results):
+        baseline = {}
+        if self.BASELINE_PATH.exists():
+            baseline = json.loads(self.BASELINE_PATH.read_text())
+        if os.environ.get('INVENTORY_BENCHMARK_UPDATE'):
+            self.BASELINE_PATH.write_text(json.dumps(
+                {f"{result['view']}:{result['size']}": result['wall_ms'] for result in results}, indent=2
+            ) + '\n')
+            return []
+
+        # Absolute slack keeps millisecond-scale views from failing on machine noise
+        tolerance = float(os.environ.get('INVENTORY_BENCHMARK_TOLERANCE', 3))
+        slack_ms = float(os.environ.get('INVENTORY_BENCHMARK_SLACK_MS', 50))
+        failures = []
+        for result in results:
+            expected = baseline.get(f"{result['view']}:{result['size']}")
+            if expected is None:
+                continue
+            result['baseline_ms'] = expected
+            if result['wall_ms'] > expected * tolerance + slack_ms:
+                failures.append(
+                    f"{result['view']} ({result['size']}): {result['wall_ms']} ms "
+                    f"exceeds baseline {expected} ms x{tolerance} + {slack_ms} ms"
+                )
+        return failures
+
+    def write_report(self, results, failures):
+        report_dir = Path(os.environ.get('INVENTORY_BENCHMARK_REPORT_DIR', settings.BASE_DIR / 'benchmark-report'))
+        report_dir.mkdir(parents=True, exist_ok=True)
+        (report_dir / 'benchmark.json').write_text(json.dumps({
+            'generated_at': timezone.now().isoformat(),
+            'results': results,
+            'failures': failures,
+        }, indent=2) + '\n')
+
+        lines = [
+            '# Endpoint benchmark',
+            '',
+            '| View | Size | Products | Transactions | Wall (ms) | Baseline (ms) | Queries | Peak memory (KiB) |',
+            '| --- | --- | ---: | ---: | ---: | ---: | ---: | ---: |',
+        ]
+        for result in results:
+            lines.append(
+                f"| {result['view']} | {result['size']} | {result['products']} | {result['transactions']} "
+                f"| {result['wall_ms']} | {result.get('baseline_ms', '-')} | {result['queries']} | {result['peak_kib']} |"
+            )
+        if failures:
+            lines += ['', '## Failures', ''] + [f'- {failure}' for failure in failures]
+        (report_dir / 'benchmark.md').write_text('\n'.join(lines) + '\n')
@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .models import StockBalance
 
 # API router
 router = DefaultRouter()
 router.register(r'products', views.ProdMastViewSet)
 router.register(r'transactions', views.StckMainViewSet)
+router.register(r'reservations', views.StockReservationViewSet)
 
 app_name = 'inventory'
 
@@ -22,6 +24,19 @@ urlpatterns = [
     # API endpoints
     path('api/', include(router.urls)),
     path('api/stock-movement/', views.StockMovementView.as_view(), name='stock_movement_api'),
+    path('api/stock-movement/bulk/', views.StockMovementBulkView.as_view(), name='stock_movement_bulk_api'),
+    path('api/stock-ledger/export.csv', views.StockLedgerExportView.as_view(output_format='csv'), name='stock_ledger_csv_api'),
+    path('api/stock-ledger/export.ndjson', views.StockLedgerExportView.as_view(output_format='ndjson'), name='stock_ledger_ndjson_api'),
     path('api/inventory-report/', views.InventoryReportView.as_view(), name='inventory_report_api'),
     path('api/historical-inventory/', views.HistoricalInventoryView.as_view(), name='historical_inventory_api'),
+    path('api/expiring-stock/', views.ExpiringStockView.as_view(), name='expiring_stock_api'),
+    path('api/low-stock/', views.StockAlertView.as_view(stock_status=StockBalance.LOW_STOCK), name='low_stock_api'),
+    path('api/out-of-stock/', views.StockAlertView.as_view(stock_status=StockBalance.OUT_OF_STOCK), name='out_of_stock_api'),
+    path('api/valuation/', views.ValuationView.as_view(), name='valuation_api'),
+    
+    # Async variants of the read-heavy endpoints, for ASGI deployments
+    path('api/async/inventory-report/', views.inventory_report_async, name='inventory_report_async_api'),
+    path('api/async/historical-inventory/', views.historical_inventory_async, name='historical_inventory_async_api'),
+    path('api/async/products/<int:product_id>/stock/', views.product_stock_async, name='product_stock_async_api'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,45 +1,254 @@
+import csv
+import hashlib
+import json
+from datetime import time, timedelta
+from decimal import Decimal
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-from django.db.models import Sum, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
 from django.utils import timezone
-from rest_framework import viewsets, status
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition, require_GET
+from rest_framework import mixins, serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
-from .models import ProdMast, StckMain, StckDetail
+from . import caching, metrics as request_metrics
+from .pagination import KeysetPagination, TransactionDatePagination, paginate_keyset
+from .models import (
+    CENT, LedgerRevision, ProdMast, StckMain, StckDetail, StockBalance, StockBatch, StockReservation,
+    StockValuation, ValuationEntry, rebuild_stock_state, record_stock_movements, stock_check_atomic
+)
 from .serializers import (
     ProdMastSerializer, StckMainSerializer, StckDetailSerializer,
-    StockMovementSerializer, InventoryReportSerializer
+    StockMovementSerializer, StockReservationSerializer, InventoryReportSerializer
 )
 
 
+def parse_query_datetime(value, default_time=time(0, 0)):
+    """Parse YYYY-MM-DD or YYYY-MM-DD HH:MM:SS into an aware datetime.
+
+    Date-only values are combined with default_time. Raises ValueError.
+    """
+    # parse_datetime() also accepts a bare date (as midnight) on Python 3.11+, so dates are tried first
+    parsed_date = parse_date(value)
+    if parsed_date:
+        parsed = timezone.datetime.combine(parsed_date, default_time)
+    else:
+        parsed = parse_datetime(value)
+        if not parsed:
+            raise ValueError("Invalid date format")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _make_etag(request, *parts):
+    # The same state renders differently per URL and per negotiated format
+    key = [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] + [str(part) for part in parts]
+    return hashlib.sha1('|'.join(key).encode()).hexdigest()
+
+
+def ledger_state(request):
+    """Counters of the ledger revision row, read once per request"""
+    state = getattr(request, '_ledger_state', None)
+    if state is None:
+        state = request._ledger_state = LedgerRevision.current()
+    return state
+
+
+def ledger_etag(request, *args, **kwargs):
+    return _make_etag(request, ledger_state(request).revision)
+
+
+def ledger_last_modified(request, *args, **kwargs):
+    return ledger_state(request).updated_at
+
+
+def historical_state(request):
+    """Target date and ledger revision of ?date=, or None when the date is missing or invalid"""
+    state = getattr(request, '_historical_state', None)
+    if state is None:
+        try:
+            target_date = parse_query_datetime(request.GET.get('date', ''), time(23, 59, 59))
+        except ValueError:
+            return None
+        state = request._historical_state = {'target_date': target_date, 'revision': ledger_state(request)}
+    return state
+
+
+def historical_etag(request, *args, **kwargs):
+    """Dates before the latest movement only change through back-dated writes, edits and product
+    changes, which all bump history_revision; later dates change with every write.
+    """
+    state = historical_state(request)
+    if state is None:
+        return None
+    revision = state['revision']
+    if revision.latest_movement_date is not None and state['target_date'] < revision.latest_movement_date:
+        return _make_etag(request, state['target_date'], 'history', revision.history_revision)
+    return _make_etag(request, state['target_date'], 'ledger', revision.revision)
+
+
+def valuation_etag(request, *args, **kwargs):
+    return historical_etag(request) if request.GET.get('date') else ledger_etag(request)
+
+
 # API Views
 class ProdMastViewSet(viewsets.ModelViewSet):
     queryset = ProdMast.objects.all()
     serializer_class = ProdMastSerializer
     
     def get_queryset(self):
-        queryset = ProdMast.objects.all()
+        queryset = ProdMast.objects.with_stock()
         is_active = self.request.query_params.get('is_active')
         if is_active is not None:
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
         return queryset
     
+    @method_decorator(condition(etag_func=ledger_etag, last_modified_func=ledger_last_modified))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'])
     def stock_movements(self, request, pk=None):
         """Get stock movements for a specific product"""
         product = self.get_object()
-        movements = StckDetail.objects.filter(product=product).select_related('stck_main')
-        serializer = StckDetailSerializer(movements, many=True)
-        return Response(serializer.data)
+        movements = StckDetail.objects.filter(product=product).select_related('stck_main', 'product')
+        paginator = KeysetPagination(key_field='created_at')
+        page = paginator.paginate_queryset(movements, request, view=self)
+        serializer = StckDetailSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    SERIES_STEPS = {'day': timedelta(days=1), 'hour': timedelta(hours=1)}
+    MAX_SERIES_POINTS = 10000
+    MAX_SERIES_PRODUCTS = 100
+    
+    def _series_window(self, request):
+        """Read from/to/step from the query string; returns (start, end, step_name) or raises ValueError"""
+        step_name = request.query_params.get('step', 'day')
+        if step_name not in self.SERIES_STEPS:
+            raise ValueError("step must be 'day' or 'hour'")
+        
+        end = timezone.now()
+        if request.query_params.get('to'):
+            end = parse_query_datetime(request.query_params['to'], time(23, 59, 59))
+        start = end - 30 * self.SERIES_STEPS[step_name]
+        if request.query_params.get('from'):
+            start = parse_query_datetime(request.query_params['from'])
+        
+        if start > end:
+            raise ValueError("'from' must be before 'to'")
+        if (end - start) / self.SERIES_STEPS[step_name] > self.MAX_SERIES_POINTS:
+            raise ValueError(f"Too many points requested (maximum {self.MAX_SERIES_POINTS})")
+        return start, end, step_name
+    
+    def _series_payload(self, products, request):
+        start, end, step_name = self._series_window(request)
+        series = products.stock_series(start, end, self.SERIES_STEPS[step_name])
+        payload = {'from': start, 'to': end, 'step': step_name, 'products': []}
+        for product in products:
+            payload['products'].append({
+                'product_id': product.id,
+                'product_code': product.product_code,
+                'series': [
+                    {'timestamp': timestamp, 'stock': stock}
+                    for timestamp, stock in series.get(product.id, [])
+                ]
+            })
+        return payload
+    
+    @action(detail=True, methods=['get'], url_path='stock-series')
+    def stock_series(self, request, pk=None):
+        """Stock level of one product at every day/hour boundary between from and to"""
+        product = self.get_object()
+        try:
+            payload = self._series_payload(ProdMast.objects.filter(pk=product.pk), request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        product_payload = payload.pop('products')[0]
+        payload.update(product_payload)
+        return Response(payload)
+    
+    @action(detail=False, methods=['get'], url_path='stock-series')
+    def stock_series_list(self, request):
+        """Stock level of several products (?ids=1,2,3) at every day/hour boundary between from and to"""
+        try:
+            product_ids = [int(product_id) for product_id in request.query_params.get('ids', '').split(',') if product_id]
+        except ValueError:
+            return Response({'error': 'ids must be a comma separated list of product IDs'}, status=status.HTTP_400_BAD_REQUEST)
+        if not product_ids:
+            return Response({'error': 'ids parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > self.MAX_SERIES_PRODUCTS:
+            return Response(
+                {'error': f'At most {self.MAX_SERIES_PRODUCTS} products can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            payload = self._series_payload(ProdMast.objects.filter(pk__in=product_ids), request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload)
+    
+    @action(detail=True, methods=['get'], url_path='fefo-pick')
+    def fefo_pick(self, request, pk=None):
+        """Batches to pick for an OUT of ?quantity=, earliest expiry first"""
+        product = self.get_object()
+        try:
+            quantity = int(request.query_params.get('quantity', ''))
+            if quantity <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'quantity must be a positive number'}, status=status.HTTP_400_BAD_REQUEST)
+        include_expired = request.query_params.get('include_expired', '').lower() == 'true'
+        
+        batches = StockBatch.objects.filter(product=product, quantity__gt=0).order_by(
+            F('expiry_date').asc(nulls_last=True), 'batch_number'
+        )
+        if not include_expired:
+            batches = batches.exclude(expiry_date__lt=timezone.localdate())
+        
+        picks = []
+        remaining = quantity
+        for batch in batches:
+            if not remaining:
+                break
+            pick = min(remaining, batch.quantity)
+            picks.append({
+                'batch_number': batch.batch_number,
+                'expiry_date': batch.expiry_date,
+                'available': batch.quantity,
+                'pick': pick
+            })
+            remaining -= pick
+        
+        return Response({
+            'product_id': product.id,
+            'product_code': product.product_code,
+            'requested': quantity,
+            'allocated': quantity - remaining,
+            'shortfall': remaining,
+            'picks': picks
+        })
 
 
 class StckMainViewSet(viewsets.ModelViewSet):
     queryset = StckMain.objects.all()
     serializer_class = StckMainSerializer
+    pagination_class = TransactionDatePagination
     
     def get_queryset(self):
-        queryset = StckMain.objects.all()
+        queryset = StckMain.objects.with_totals().with_details()
         transaction_type = self.request.query_params.get('transaction_type')
         if transaction_type:
             queryset = queryset.filter(transaction_type=transaction_type)
@@ -52,6 +261,48 @@ class StckMainViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(transaction_date__lte=date_to)
         
         return queryset
+    
+    # Header edits change the sign and date of every line, so the derived
+    # stock of the products involved is recomputed in the same transaction.
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            since = serializer.instance.transaction_date
+            stck_main = serializer.save()
+            rebuild_stock_state(
+                set(stck_main.details.values_list('product_id', flat=True)),
+                since=min(since, stck_main.transaction_date)
+            )
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            product_ids = set(instance.details.values_list('product_id', flat=True))
+            instance.delete()
+            rebuild_stock_state(product_ids, since=instance.transaction_date)
+
+
+class StockReservationViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                              mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Holds on product stock. DELETE releases a hold and keeps its record."""
+    queryset = StockReservation.objects.all()
+    serializer_class = StockReservationSerializer
+    
+    def get_queryset(self):
+        queryset = StockReservation.objects.select_related('product')
+        product = self.request.query_params.get('product')
+        if product:
+            queryset = queryset.filter(product_id=product)
+        if self.request.query_params.get('active', '').lower() == 'true':
+            queryset = queryset.filter(status='ACTIVE', expires_at__gt=timezone.now())
+        return queryset
+    
+    def destroy(self, request, *args, **kwargs):
+        reservation = self.get_object()
+        if not reservation.release():
+            return Response(
+                {'error': f'Reservation {reservation.id} is already {reservation.get_status_display().lower()}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(reservation).data)
 
 
 class StockMovementView(APIView):
@@ -78,44 +329,280 @@ class StockMovementView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class InventoryReportView(APIView):
-    """API endpoint for inventory reports"""
+class StockMovementBulkView(APIView):
+    """API endpoint for ingesting many stock movements from an NDJSON stream.
+
+    Each line of the body is one StockMovementSerializer payload. Lines are
+    committed in batches of ?batch_size= (each line in its own savepoint, so
+    one bad line does not undo its batch) and one NDJSON result per line is
+    streamed back as soon as its batch commits, followed by a summary line.
+    """
+    MAX_BATCH_SIZE = 5000
+    
+    def post(self, request):
+        try:
+            batch_size = int(request.query_params.get('batch_size', getattr(settings, 'INVENTORY_BULK_BATCH_SIZE', 500)))
+        except ValueError:
+            batch_size = 0
+        if not 1 <= batch_size <= self.MAX_BATCH_SIZE:
+            return Response({
+                'success': False,
+                'message': f'batch_size must be between 1 and {self.MAX_BATCH_SIZE}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Read the underlying Django request line by line so the body is never held in memory
+        lines = iter(request._request.readline, b'')
+        return StreamingHttpResponse(
+            self._ingest(lines, batch_size),
+            content_type='application/x-ndjson'
+        )
+    
+    def _ingest(self, lines, batch_size):
+        summary = {'received': 0, 'created': 0, 'failed': 0}
+        batch = []
+        for line_number, raw_line in enumerate(lines, start=1):
+            if not raw_line.strip():
+                continue
+            summary['received'] += 1
+            batch.append((line_number, raw_line))
+            if len(batch) >= batch_size:
+                yield from self._commit_batch(batch, summary)
+                batch = []
+        if batch:
+            yield from self._commit_batch(batch, summary)
+        yield json.dumps({'summary': summary}) + '\n'
+    
+    def _commit_batch(self, batch, summary):
+        results = []
+        with stock_check_atomic():
+            for line_number, raw_line in batch:
+                result = self._ingest_line(line_number, raw_line)
+                summary['created' if result['success'] else 'failed'] += 1
+                results.append(json.dumps(result, default=str) + '\n')
+        yield from results
+    
+    def _ingest_line(self, line_number, raw_line):
+        try:
+            data = json.loads(raw_line)
+        except ValueError as e:
+            return {'line': line_number, 'success': False, 'message': f'Invalid JSON: {e}'}
+        
+        serializer = StockMovementSerializer(data=data)
+        if not serializer.is_valid():
+            return {'line': line_number, 'success': False, 'errors': serializer.errors}
+        try:
+            with transaction.atomic():
+                stock_main = serializer.save()
+        except serializers.ValidationError as e:
+            return {'line': line_number, 'success': False, 'errors': e.detail}
+        except Exception as e:
+            return {'line': line_number, 'success': False, 'message': str(e)}
+        return {'line': line_number, 'success': True, 'transaction_id': stock_main.transaction_id}
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+    
+    def write(self, value):
+        return value
+
+
+class StockLedgerExportView(APIView):
+    """API endpoint for exporting the stock movement ledger as CSV or NDJSON.
+    
+    Rows are streamed from a server-side cursor, so memory stays constant
+    however many movements match. The columns are the ones import_movements reads.
+    """
+    COLUMNS = [
+        'transaction_id', 'transaction_date', 'transaction_type', 'reference_number', 'created_by',
+        'product_code', 'quantity', 'unit_price', 'batch_number', 'expiry_date', 'remarks',
+    ]
+    CHUNK_SIZE = 2000
+    output_format = 'csv'
     
     def get(self, request):
-        products = ProdMast.objects.filter(is_active=True)
-        report_data = []
+        movements = StckDetail.objects.select_related('stck_main', 'product').order_by('transaction_date', 'id')
+        
+        product = request.query_params.get('product')
+        if product:
+            movements = movements.filter(product_id=product) if product.isdigit() else movements.filter(product__product_code=product.upper())
+        transaction_type = request.query_params.get('transaction_type')
+        if transaction_type:
+            movements = movements.filter(stck_main__transaction_type=transaction_type)
+        try:
+            if request.query_params.get('date_from'):
+                movements = movements.filter(
+                    transaction_date__gte=parse_query_datetime(request.query_params['date_from'])
+                )
+            if request.query_params.get('date_to'):
+                movements = movements.filter(
+                    transaction_date__lte=parse_query_datetime(request.query_params['date_to'], time(23, 59, 59))
+                )
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = (self._row(movement) for movement in movements.iterator(chunk_size=self.CHUNK_SIZE))
+        if self.output_format == 'ndjson':
+            content = (json.dumps(dict(zip(self.COLUMNS, row)), default=str) + '\n' for row in rows)
+            response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+        else:
+            writer = csv.writer(Echo())
+            content = (writer.writerow(row) for row in self._with_header(rows))
+            response = StreamingHttpResponse(content, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="stock-ledger.{self.output_format}"'
+        return response
+    
+    def _with_header(self, rows):
+        yield self.COLUMNS
+        yield from rows
+    
+    def _row(self, movement):
+        stck_main = movement.stck_main
+        return [
+            stck_main.transaction_id,
+            stck_main.transaction_date.isoformat(),
+            stck_main.transaction_type,
+            stck_main.reference_number,
+            stck_main.created_by,
+            movement.product.product_code,
+            movement.quantity,
+            str(movement.unit_price),
+            movement.batch_number,
+            movement.expiry_date.isoformat() if movement.expiry_date else '',
+            movement.remarks,
+        ]
+
+
+class ExpiringStockView(APIView):
+    """API endpoint for batches with stock left that expire within ?days= (default 30)"""
+    
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+            if days < 0:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'days must be a non-negative number'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        today = timezone.localdate()
+        batches = StockBatch.objects.filter(
+            quantity__gt=0,
+            expiry_date__lte=today + timedelta(days=days)
+        ).select_related('product').order_by('expiry_date', 'product_id')
+        if request.query_params.get('include_expired', '').lower() != 'true':
+            batches = batches.filter(expiry_date__gte=today)
+        if request.query_params.get('product'):
+            batches = batches.filter(product_id=request.query_params['product'])
+        
+        expiring = []
+        for batch in batches:
+            expiring.append({
+                'product_id': batch.product_id,
+                'product_code': batch.product.product_code,
+                'product_name': batch.product.product_name,
+                'unit': batch.product.unit,
+                'batch_number': batch.batch_number,
+                'expiry_date': batch.expiry_date,
+                'days_left': (batch.expiry_date - today).days,
+                'quantity': batch.quantity
+            })
         
+        return Response({
+            'as_of': today,
+            'days': days,
+            'batches': expiring
+        })
+
+
+class StockAlertView(APIView):
+    """API endpoint for the active products in one stock status (low or out of stock).
+    
+    Products are read through the maintained status of their balance row, so
+    the cost follows the number of alerting products rather than the catalog.
+    """
+    stock_status = StockBalance.LOW_STOCK
+    
+    def get(self, request):
+        products = StockBalance.alerts(self.stock_status)
+        
+        alerts = []
         for product in products:
-            # Get last movement date
-            last_movement = StckDetail.objects.filter(product=product).order_by('-created_at').first()
-            last_movement_date = last_movement.created_at if last_movement else None
-            
-            # Determine stock status
-            current_stock = product.current_stock
-            if current_stock <= 0:
-                stock_status = 'Out of Stock'
-            elif current_stock <= product.minimum_stock:
-                stock_status = 'Low Stock'
-            else:
-                stock_status = 'In Stock'
-            
-            report_data.append({
+            alerts.append({
                 'product_code': product.product_code,
                 'product_name': product.product_name,
                 'unit': product.unit,
-                'current_stock': current_stock,
+                'current_stock': product.stock_level,
                 'minimum_stock': product.minimum_stock,
-                'stock_status': stock_status,
-                'last_movement_date': last_movement_date
+                'stock_status': product.stock_status,
+                'last_movement_date': product.last_movement_date
+            })
+        
+        return Response({
+            'stock_status': self.stock_status,
+            'count': len(alerts),
+            'products': InventoryReportSerializer(alerts, many=True).data
+        })
+
+
+class InventoryReportView(APIView):
+    """API endpoint for inventory reports"""
+    
+    @method_decorator(condition(etag_func=ledger_etag, last_modified_func=ledger_last_modified))
+    def get(self, request):
+        report_data = []
+        
+        for row in caching.product_rows():
+            report_data.append({
+                'product_code': row['product_code'],
+                'product_name': row['product_name'],
+                'unit': row['unit'],
+                'current_stock': row['stock_level'],
+                'minimum_stock': row['minimum_stock'],
+                'stock_status': row['stock_status'],
+                'last_movement_date': row['last_movement_date']
             })
         
         serializer = InventoryReportSerializer(report_data, many=True)
         return Response(serializer.data)
 
 
+def historical_row(product, target_date):
+    """Report row of a product annotated by ProdMast.objects.with_stock_at()"""
+    return {
+        'product_code': product.product_code,
+        'product_name': product.product_name,
+        'unit': product.unit,
+        'stock_at_date': product.historical_stock,
+        'minimum_stock': product.minimum_stock,
+        'stock_status': product.historical_status,
+        'last_movement_date': product.last_movement_before,
+        'query_date': target_date
+    }
+
+
+def patch_historical_cache_control(response, state, target_date):
+    """Let clients cache settled history and revalidate anything else"""
+    # A date before the latest movement is settled history, unless back-dated
+    # writes, edits or deletes have ever reached back to it
+    revision = state['revision']
+    settled = (
+        revision.latest_movement_date is not None
+        and target_date < revision.latest_movement_date
+        and (revision.backdated_from is None or target_date < revision.backdated_from)
+    )
+    if settled:
+        patch_cache_control(response, max_age=getattr(settings, 'INVENTORY_HISTORICAL_MAX_AGE', 86400))
+    else:
+        patch_cache_control(response, no_cache=True)
+
+
 class HistoricalInventoryView(APIView):
     """API endpoint for historical inventory at a specific date and time"""
     
+    @method_decorator(condition(etag_func=historical_etag))
     def get(self, request):
         # Get the target date from query parameters
         target_date_str = request.query_params.get('date')
@@ -126,82 +613,209 @@ class HistoricalInventoryView(APIView):
             )
         
         try:
-            # Parse the date
-            from django.utils.dateparse import parse_datetime, parse_date
-            target_date = parse_datetime(target_date_str)
-            if not target_date:
-                # Try parsing as date only
-                parsed_date = parse_date(target_date_str)
-                if parsed_date:
-                    # Set time to end of day for date-only queries
-                    from datetime import time
-                    target_date = timezone.make_aware(
-                        timezone.datetime.combine(parsed_date, time(23, 59, 59))
-                    )
-                else:
-                    raise ValueError("Invalid date format")
+            # Date-only queries cover the whole day
+            target_date = parse_query_datetime(target_date_str, time(23, 59, 59))
         except ValueError:
             return Response(
                 {'error': 'Invalid date format. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        products = ProdMast.objects.filter(is_active=True)
-        historical_data = []
+        products = ProdMast.objects.with_stock_at(target_date).filter(is_active=True)
+        historical_data = [historical_row(product, target_date) for product in products]
         
-        for product in products:
-            # Calculate stock at the target date
-            historical_stock = product.stock_at_date(target_date)
-            
-            # Get last movement before target date
-            last_movement = StckDetail.objects.filter(
-                product=product,
-                stck_main__transaction_date__lte=target_date
-            ).order_by('-stck_main__transaction_date').first()
-            
-            last_movement_date = last_movement.stck_main.transaction_date if last_movement else None
-            
-            # Determine stock status at that time
-            if historical_stock <= 0:
-                stock_status = 'Out of Stock'
-            elif historical_stock <= product.minimum_stock:
-                stock_status = 'Low Stock'
-            else:
-                stock_status = 'In Stock'
-            
-            historical_data.append({
-                'product_code': product.product_code,
-                'product_name': product.product_name,
-                'unit': product.unit,
-                'stock_at_date': historical_stock,
-                'minimum_stock': product.minimum_stock,
-                'stock_status': stock_status,
-                'last_movement_date': last_movement_date,
-                'query_date': target_date
+        response = Response({
+            'query_date': target_date,
+            'inventory_snapshot': historical_data
+        })
+        patch_historical_cache_control(response, historical_state(request), target_date)
+        return response
+
+
+class ValuationView(APIView):
+    """API endpoint for inventory value at weighted-average and FIFO cost, now or at ?date="""
+    
+    @method_decorator(condition(etag_func=valuation_etag))
+    def get(self, request):
+        target_date = None
+        if request.query_params.get('date'):
+            try:
+                # Date-only queries cover the whole day
+                target_date = parse_query_datetime(request.query_params['date'], time(23, 59, 59))
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid date format. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        if target_date is None:
+            valuations = StockValuation.objects.all()
+        else:
+            # The latest entry of each product up to the date, found through its index
+            latest = ValuationEntry.objects.filter(
+                product=OuterRef('pk'),
+                transaction_date__lte=target_date
+            ).order_by('-transaction_date', '-detail')
+            valuations = ValuationEntry.objects.filter(
+                detail__in=ProdMast.objects.annotate(
+                    entry=Subquery(latest.values('detail')[:1])
+                ).filter(entry__isnull=False).values('entry')
+            )
+        valuations = valuations.exclude(quantity=0).select_related('product').order_by('product__product_code')
+        if request.query_params.get('product'):
+            valuations = valuations.filter(product_id=request.query_params['product'])
+        
+        rows = []
+        average_total = fifo_total = Decimal(0)
+        for valuation in valuations:
+            average_total += valuation.average_value
+            fifo_total += valuation.fifo_value
+            rows.append({
+                'product_id': valuation.product_id,
+                'product_code': valuation.product.product_code,
+                'product_name': valuation.product.product_name,
+                'unit': valuation.product.unit,
+                'quantity': valuation.quantity,
+                'average_cost': str(valuation.average_cost),
+                'average_value': str(valuation.average_value.quantize(CENT)),
+                'fifo_value': str(valuation.fifo_value.quantize(CENT))
             })
         
         return Response({
-            'query_date': target_date,
-            'inventory_snapshot': historical_data
+            'as_of': target_date or timezone.now(),
+            'products': rows,
+            'total_average_value': str(average_total.quantize(CENT)),
+            'total_fifo_value': str(fifo_total.quantize(CENT))
+        })
+
+
+# Async API Views
+# DRF's APIView cannot run async handlers, so these are plain Django views. Under
+# ASGI (warehouse_inventory.asgi) a slow report waits on the database without
+# holding a worker, so the write endpoints stay responsive.
+def async_condition(etag_func, last_modified_func=None):
+    """condition() for async views, running the database-bound ETag and Last-Modified functions in a thread"""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            def validators():
+                etag = etag_func(request, *args, **kwargs)
+                last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+                return etag, last_modified
+
+            etag, last_modified = await sync_to_async(validators)()
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+@require_GET
+@async_condition(ledger_etag, ledger_last_modified)
+async def inventory_report_async(request):
+    """Async variant of InventoryReportView, streaming the rows from the async ORM"""
+    report_data = []
+    products = ProdMast.objects.with_stock().filter(is_active=True).order_by('id')
+    async for product in products.aiterator(chunk_size=2000):
+        report_data.append({
+            'product_code': product.product_code,
+            'product_name': product.product_name,
+            'unit': product.unit,
+            'current_stock': product.stock_level,
+            'minimum_stock': product.minimum_stock,
+            'stock_status': product.stock_status,
+            'last_movement_date': product.last_movement_date
         })
+    
+    serializer = InventoryReportSerializer(report_data, many=True)
+    return JsonResponse(serializer.data, encoder=JSONEncoder, safe=False)
+
+
+@require_GET
+@async_condition(historical_etag)
+async def historical_inventory_async(request):
+    """Async variant of HistoricalInventoryView"""
+    target_date_str = request.GET.get('date')
+    if not target_date_str:
+        return JsonResponse(
+            {'error': 'Date parameter is required. Format: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        # Date-only queries cover the whole day
+        target_date = parse_query_datetime(target_date_str, time(23, 59, 59))
+    except ValueError:
+        return JsonResponse(
+            {'error': 'Invalid date format. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    products = ProdMast.objects.with_stock_at(target_date).filter(is_active=True)
+    historical_data = [historical_row(product, target_date) async for product in products.aiterator(chunk_size=2000)]
+    
+    response = JsonResponse({
+        'query_date': target_date,
+        'inventory_snapshot': historical_data
+    }, encoder=JSONEncoder)
+    patch_historical_cache_control(response, await sync_to_async(historical_state)(request), target_date)
+    return response
+
+
+@require_GET
+async def product_stock_async(request, product_id):
+    """Current stock of one product, and its stock at ?date= if given, read in one query"""
+    target_date = None
+    if request.GET.get('date'):
+        try:
+            target_date = parse_query_datetime(request.GET['date'], time(23, 59, 59))
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Invalid date format. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    products = ProdMast.objects.with_stock()
+    if target_date is not None:
+        products = products.with_stock_at(target_date)
+    product = await products.filter(id=product_id).afirst()
+    if product is None:
+        return JsonResponse({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    data = {
+        'product_id': product.id,
+        'product_code': product.product_code,
+        'product_name': product.product_name,
+        'unit': product.unit,
+        'minimum_stock': product.minimum_stock,
+        'current_stock': product.stock_level,
+        'stock_status': product.stock_status,
+        'last_movement_date': product.last_movement_date
+    }
+    if target_date is not None:
+        data['query_date'] = target_date
+        data['stock_at_date'] = product.historical_stock
+    return JsonResponse(data, encoder=JSONEncoder)
 
 
 # Web Views
 def dashboard(request):
     """Main dashboard view"""
-    # Get summary statistics
+    # Get summary statistics; the alert lists come from the indexed stock status
     total_products = ProdMast.objects.filter(is_active=True).count()
-    low_stock_products = []
-    out_of_stock_products = []
-    
-    for product in ProdMast.objects.filter(is_active=True):
-        current_stock = product.current_stock
-        if current_stock <= 0:
-            out_of_stock_products.append(product)
-        elif current_stock <= product.minimum_stock:
-            low_stock_products.append(product)
+    low_stock_products = list(StockBalance.alerts(StockBalance.LOW_STOCK))
+    out_of_stock_products = list(StockBalance.alerts(StockBalance.OUT_OF_STOCK))
     
-    recent_transactions = StckMain.objects.all()[:10]
+    recent_transactions = caching.recent_transactions()
     
     context = {
         'total_products': total_products,
@@ -217,11 +831,8 @@ def dashboard(request):
 
 def product_list(request):
     """Product list view"""
-    products = ProdMast.objects.filter(is_active=True)
-    
-    # Add current stock to each product
-    for product in products:
-        product.stock_level = product.current_stock
+    # Cached stock rows, rebuilt only for products that changed
+    products = caching.product_rows()
     
     return render(request, 'inventory/product_list.html', {'products': products})
 
@@ -230,12 +841,16 @@ def product_detail(request, product_id):
     """Product detail view"""
     product = get_object_or_404(ProdMast, id=product_id)
     
-    # Get stock movements for this product
-    movements = StckDetail.objects.filter(product=product).select_related('stck_main').order_by('-created_at')
+    # Get stock movements for this product, one keyset page at a time
+    movements = StckDetail.objects.filter(product=product).select_related('stck_main')
+    try:
+        page = paginate_keyset(movements, 'created_at', cursor=request.GET.get('cursor'))
+    except ValueError:
+        raise Http404("Invalid cursor")
     
     context = {
         'product': product,
-        'movements': movements,
+        'movements': page,
         'current_stock': product.current_stock
     }
     
@@ -251,30 +866,38 @@ def stock_in_form(request):
         remarks = request.POST.get('remarks', '')
         created_by = request.POST.get('created_by')
         
-        # Create transaction
-        stock_main = StckMain.objects.create(
-            transaction_id=transaction_id,
-            transaction_date=timezone.now(),
-            transaction_type='IN',
-            reference_number=reference_number,
-            remarks=remarks,
-            created_by=created_by
-        )
-        
         # Process items (assuming they're passed as form data)
         product_ids = request.POST.getlist('product_id')
         quantities = request.POST.getlist('quantity')
         unit_prices = request.POST.getlist('unit_price')
         
-        for i, product_id in enumerate(product_ids):
-            if product_id and quantities[i] and unit_prices[i]:
-                product = ProdMast.objects.get(id=product_id)
-                StckDetail.objects.create(
-                    stck_main=stock_main,
-                    product=product,
-                    quantity=int(quantities[i]),
-                    unit_price=float(unit_prices[i])
-                )
+        with transaction.atomic():
+            # Create transaction
+            stock_main = StckMain.objects.create(
+                transaction_id=transaction_id,
+                transaction_date=timezone.now(),
+                transaction_type='IN',
+                reference_number=reference_number,
+                remarks=remarks,
+                created_by=created_by
+            )
+            
+            deltas = {}
+            details = []
+            for i, product_id in enumerate(product_ids):
+                if product_id and quantities[i] and unit_prices[i]:
+                    product = ProdMast.objects.get(id=product_id)
+                    detail = StckDetail.objects.create(
+                        stck_main=stock_main,
+                        product=product,
+                        quantity=int(quantities[i]),
+                        unit_price=float(unit_prices[i])
+                    )
+                    details.append(detail)
+                    deltas[product.id] = deltas.get(product.id, 0) + int(quantities[i])
+            
+            if deltas:
+                record_stock_movements(deltas, stock_main.transaction_date, moved_at=detail.created_at, details=details)
         
         return render(request, 'inventory/success.html', {
             'message': 'Stock in transaction created successfully',
@@ -295,49 +918,58 @@ def stock_out_form(request):
         remarks = request.POST.get('remarks', '')
         created_by = request.POST.get('created_by')
         
-        # Validate stock availability first
         product_ids = request.POST.getlist('product_id')
         quantities = request.POST.getlist('quantity')
-        
-        errors = []
-        for i, product_id in enumerate(product_ids):
-            if product_id and quantities[i]:
-                product = ProdMast.objects.get(id=product_id)
-                requested_qty = int(quantities[i])
-                current_stock = product.current_stock
-                
-                if requested_qty > current_stock:
-                    errors.append(f"Insufficient stock for {product.product_name}. Available: {current_stock}, Requested: {requested_qty}")
-        
-        if errors:
-            products = ProdMast.objects.filter(is_active=True)
-            return render(request, 'inventory/stock_out_form.html', {
-                'products': products,
-                'errors': errors
-            })
-        
-        # Create transaction
-        stock_main = StckMain.objects.create(
-            transaction_id=transaction_id,
-            transaction_date=timezone.now(),
-            transaction_type='OUT',
-            reference_number=reference_number,
-            remarks=remarks,
-            created_by=created_by
-        )
-        
-        # Process items
         unit_prices = request.POST.getlist('unit_price')
         
-        for i, product_id in enumerate(product_ids):
-            if product_id and quantities[i] and unit_prices[i]:
-                product = ProdMast.objects.get(id=product_id)
-                StckDetail.objects.create(
-                    stck_main=stock_main,
-                    product=product,
-                    quantity=int(quantities[i]),
-                    unit_price=float(unit_prices[i])
-                )
+        with stock_check_atomic():
+            # Validate stock availability with the balances locked, so a concurrent
+            # stock out of the same product cannot pass the same check
+            available = StockReservation.lock_available(
+                [int(product_id) for i, product_id in enumerate(product_ids) if product_id and quantities[i]]
+            )
+            errors = []
+            for i, product_id in enumerate(product_ids):
+                if product_id and quantities[i]:
+                    product = ProdMast.objects.get(id=product_id)
+                    requested_qty = int(quantities[i])
+                    
+                    if requested_qty > available[product.id]:
+                        errors.append(f"Insufficient stock for {product.product_name}. Available: {available[product.id]}, Requested: {requested_qty}")
+            
+            if errors:
+                products = ProdMast.objects.filter(is_active=True)
+                return render(request, 'inventory/stock_out_form.html', {
+                    'products': products,
+                    'errors': errors
+                })
+            
+            # Create transaction
+            stock_main = StckMain.objects.create(
+                transaction_id=transaction_id,
+                transaction_date=timezone.now(),
+                transaction_type='OUT',
+                reference_number=reference_number,
+                remarks=remarks,
+                created_by=created_by
+            )
+            
+            deltas = {}
+            details = []
+            for i, product_id in enumerate(product_ids):
+                if product_id and quantities[i] and unit_prices[i]:
+                    product = ProdMast.objects.get(id=product_id)
+                    detail = StckDetail.objects.create(
+                        stck_main=stock_main,
+                        product=product,
+                        quantity=int(quantities[i]),
+                        unit_price=float(unit_prices[i])
+                    )
+                    details.append(detail)
+                    deltas[product.id] = deltas.get(product.id, 0) - int(quantities[i])
+            
+            if deltas:
+                record_stock_movements(deltas, stock_main.transaction_date, moved_at=detail.created_at, details=details)
         
         return render(request, 'inventory/success.html', {
             'message': 'Stock out transaction created successfully',
@@ -350,15 +982,20 @@ def stock_out_form(request):
 
 def transaction_list(request):
     """Transaction list view"""
-    transactions = StckMain.objects.all()
+    transactions = StckMain.objects.with_totals()
     
     # Filter by transaction type if provided
     transaction_type = request.GET.get('type')
     if transaction_type:
         transactions = transactions.filter(transaction_type=transaction_type)
     
+    try:
+        page = paginate_keyset(transactions, 'transaction_date', cursor=request.GET.get('cursor'))
+    except ValueError:
+        raise Http404("Invalid cursor")
+    
     return render(request, 'inventory/transaction_list.html', {
-        'transactions': transactions,
+        'transactions': page,
         'current_filter': transaction_type
     })
 
@@ -382,37 +1019,22 @@ def historical_inventory(request):
                     timezone.datetime.combine(parsed_date, time(23, 59, 59))
                 )
                 
-                # Get all active products
-                products = ProdMast.objects.filter(is_active=True)
+                # Get all active products with their stock at the target date
+                products = ProdMast.objects.with_stock().with_stock_at(query_date).filter(is_active=True)
+                status_classes = {'Out of Stock': 'danger', 'Low Stock': 'warning', 'In Stock': 'success'}
+                transaction_types = dict(StckMain.TRANSACTION_TYPES)
                 
                 for product in products:
-                    # Calculate stock at the target date
-                    historical_stock = product.stock_at_date(query_date)
-                    
-                    # Get last movement before target date
-                    last_movement = StckDetail.objects.filter(
-                        product=product,
-                        stck_main__transaction_date__lte=query_date
-                    ).select_related('stck_main').order_by('-stck_main__transaction_date').first()
-                    
-                    # Determine stock status at that time
-                    if historical_stock <= 0:
-                        stock_status = 'danger'  # Red
-                        stock_status_text = 'Out of Stock'
-                    elif historical_stock <= product.minimum_stock:
-                        stock_status = 'warning'  # Yellow
-                        stock_status_text = 'Low Stock'
-                    else:
-                        stock_status = 'success'  # Green
-                        stock_status_text = 'In Stock'
-                    
+                    historical_stock = product.historical_stock
                     historical_data.append({
                         'product': product,
                         'stock_at_date': historical_stock,
-                        'stock_status': stock_status,
-                        'stock_status_text': stock_status_text,
-                        'last_movement': last_movement,
-                        'has_movements': historical_stock > 0 or last_movement is not None
+                        'stock_status': status_classes[product.historical_status],
+                        'stock_status_text': product.historical_status,
+                        'last_movement_date': product.last_movement_before,
+                        'last_movement_type': product.last_movement_type_before,
+                        'last_movement_type_display': transaction_types.get(product.last_movement_type_before),
+                        'has_movements': historical_stock > 0 or product.last_movement_before is not None
                     })
             else:
                 error_message = "Invalid date format. Please use YYYY-MM-DD format."
@@ -428,3 +1050,8 @@ def historical_inventory(request):
     }
     
     return render(request, 'inventory/historical_inventory.html', context)
+
+
+def metrics(request):
+    """Request and database metrics of all workers, in Prometheus text format"""
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.MetricsMiddleware',
+    'inventory.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'warehouse_inventory.urls'
@@ -74,10 +79,16 @@ WSGI_APPLICATION = 'warehouse_inventory.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Names the test database file of this run; parallel test workers inherit it from the environment
+test_run = os.environ.setdefault('WAREHOUSE_INVENTORY_TEST_RUN', str(os.getpid()))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # The default in-memory test database fails concurrent writers instead of letting
+        # them wait, which the threaded tests need; one file per run, so runs can overlap
+        'TEST': {'NAME': Path(tempfile.gettempdir()) / f'warehouse-inventory-test-{test_run}.sqlite3'},
     }
 }
 
@@ -123,6 +134,49 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process: cache keys come from database versions, so each gunicorn worker
+# stays correct, but it warms its own copy. A shared backend lets the workers share one, e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' with 'LOCATION': BASE_DIR / 'cache'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'warehouse-inventory',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
+# Inventory
+# Seconds the dashboard, product list and inventory report rows stay cached
+INVENTORY_CACHE_TIMEOUT = 300
+# Re-warm those caches in a background thread after each write, off the request thread
+INVENTORY_CACHE_WARM_IN_BACKGROUND = True
+# Cache-Control max-age of /api/historical-inventory/ for dates before the latest movement
+INVENTORY_HISTORICAL_MAX_AGE = 86400
+# Interval of the closing-balance snapshots written by build_stock_snapshots ('day' or 'month')
+INVENTORY_SNAPSHOT_PERIOD = 'day'
+# Default number of NDJSON lines committed per transaction by /api/stock-movement/bulk/
+INVENTORY_BULK_BATCH_SIZE = 500
+# Directory shared by all workers on a host for the /metrics counters
+INVENTORY_METRICS_DIR = Path(tempfile.gettempdir()) / 'warehouse-inventory-metrics'
+# Seconds between writes of each worker's counters to INVENTORY_METRICS_DIR
+INVENTORY_METRICS_FLUSH_INTERVAL = 1.0
+# Log queries slower than this many milliseconds to the slowquery table (None disables the log)
+INVENTORY_SLOW_QUERY_MS = None
+# Number of most recent slow queries kept
+INVENTORY_SLOW_QUERY_LIMIT = 10000
+# Requests with an X-Profile-Token header equal to this are run under cProfile (None disables the header)
+INVENTORY_PROFILE_TOKEN = None
+# Share of all requests profiled at random (0 disables sampling)
+INVENTORY_PROFILE_SAMPLE_RATE = 0
+# Directory of the saved .prof files and their metadata, of which the latest INVENTORY_PROFILE_LIMIT are kept
+INVENTORY_PROFILE_DIR = Path(tempfile.gettempdir()) / 'warehouse-inventory-profiles'
+INVENTORY_PROFILE_LIMIT = 200
+# Seconds a stock reservation holds its quantity when the request does not set ttl_seconds
+INVENTORY_RESERVATION_TTL = 900
+
 # Render specific settings
 import os
 import dj_database_url